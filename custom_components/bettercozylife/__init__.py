@@ -1,10 +1,26 @@
 """The BetterCozyLife integration."""
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.const import CONF_IP_ADDRESS, CONF_NAME
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr, entity_registry as er
 import logging
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    DATA_SCHEDULER,
+    DATA_POOL,
+    DATA_BOOT,
+    CONF_DEVICE_ID,
+    CONF_CAPABILITIES,
+    CONF_FAST_START,
+    DEFAULT_FAST_START,
+)
 from .coordinator import CozyLifeCoordinator
+from .metrics import BootMetrics
+from .pool import CozyLifeConnectionPool
+from .prometheus import CozyLifeMetricsView
+from .scheduler import CozyLifePollScheduler
+from .services import async_setup_services
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -13,18 +29,69 @@ PLATFORMS = [Platform.SWITCH, Platform.SENSOR]
 async def async_setup(hass: HomeAssistant, config: dict):
     """Set up the BetterCozyLife component."""
     hass.data.setdefault(DOMAIN, {})
+    # Entry setup times are measured from here, when Home Assistant starts the integration
+    hass.data[DOMAIN][DATA_BOOT] = BootMetrics(hass.loop.time())
+    await async_setup_services(hass)
+    hass.http.register_view(CozyLifeMetricsView())
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up BetterCozyLife from a config entry."""
     hass.data.setdefault(DOMAIN, {})
 
+    # All plugs lease their connections from one pool with a cap on open sockets
+    pool = hass.data[DOMAIN].get(DATA_POOL)
+    if pool is None:
+        pool = hass.data[DOMAIN][DATA_POOL] = CozyLifeConnectionPool(hass)
+
+    boot = hass.data[DOMAIN].get(DATA_BOOT)
+    if boot is None:
+        boot = hass.data[DOMAIN][DATA_BOOT] = BootMetrics(hass.loop.time())
+    started = hass.loop.time()
+
     # Create and store a shared update coordinator per entry
-    coordinator = CozyLifeCoordinator(hass, entry)
-    await coordinator.async_config_entry_first_refresh()
+    coordinator = CozyLifeCoordinator(hass, entry, pool)
+    # Fast start needs the device id and capabilities from an earlier setup,
+    # since the entities cannot be created without them
+    fast_start = (
+        entry.options.get(CONF_FAST_START, DEFAULT_FAST_START)
+        and coordinator.device_id is not None
+        and CONF_CAPABILITIES in entry.data
+    )
+    if fast_start:
+        # Entities start from their restored state; the scheduler polls at once
+        _async_track_first_refresh(hass, boot, coordinator)
+    else:
+        await coordinator.async_config_entry_first_refresh()
+        if not coordinator.device_id:
+            await _async_migrate_to_device_id(hass, entry, coordinator)
+        if CONF_CAPABILITIES not in entry.data:
+            await coordinator.async_probe_capabilities()
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
+    # One scheduler polls every entry so timers do not multiply with plug count;
+    # its concurrency cap also bounds the background first refreshes
+    scheduler = hass.data[DOMAIN].get(DATA_SCHEDULER)
+    if scheduler is None:
+        scheduler = hass.data[DOMAIN][DATA_SCHEDULER] = CozyLifePollScheduler(hass)
+    scheduler.async_register(coordinator, poll_now=fast_start)
+    boot.record_setup(entry.entry_id, hass.loop.time() - started, fast_start)
+
+    # The options flow saves new settings without reloading; entry updates made
+    # by the coordinator itself (a re-resolved IP, probed capabilities) do not
+    # change these and need no reload
+    settings = (dict(entry.options), entry.data.get(CONF_NAME))
+
+    async def _async_entry_updated(hass: HomeAssistant, updated: ConfigEntry) -> None:
+        if (
+            (dict(updated.options), updated.data.get(CONF_NAME)) != settings
+            or updated.data.get(CONF_IP_ADDRESS) != coordinator.ip
+        ):
+            await hass.config_entries.async_reload(updated.entry_id)
+
+    entry.async_on_unload(entry.add_update_listener(_async_entry_updated))
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
 
@@ -32,5 +99,76 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator: CozyLifeCoordinator = hass.data[DOMAIN].pop(entry.entry_id)
+        boot: BootMetrics = hass.data[DOMAIN].get(DATA_BOOT)
+        if boot is not None:
+            boot.forget(entry.entry_id)
+        scheduler: CozyLifePollScheduler = hass.data[DOMAIN].get(DATA_SCHEDULER)
+        if scheduler is not None:
+            scheduler.async_unregister(coordinator)
+            if scheduler.is_empty:
+                hass.data[DOMAIN].pop(DATA_SCHEDULER)
+                await scheduler.async_stop()
+        await coordinator.async_shutdown()
+        if not any(isinstance(value, CozyLifeCoordinator) for value in hass.data[DOMAIN].values()):
+            pool: CozyLifeConnectionPool = hass.data[DOMAIN].pop(DATA_POOL, None)
+            if pool is not None:
+                await pool.async_stop()
     return unload_ok
+
+
+@callback
+def _async_track_first_refresh(hass: HomeAssistant, boot: BootMetrics, coordinator: CozyLifeCoordinator) -> None:
+    """Record in the boot metrics when a fast-started entry finishes its first poll."""
+    unsub: CALLBACK_TYPE | None = None
+    polls = coordinator.device.metrics.polls
+
+    @callback
+    def _async_first_update() -> None:
+        # Listeners also run for pushes and optimistic switch states; only a
+        # finished poll counts, successful or not, and only the first one
+        if coordinator.device.metrics.polls == polls:
+            return
+        unsub()
+        boot.record_first_refresh(
+            coordinator.entry.entry_id, coordinator.last_update_success, hass.loop.time()
+        )
+
+    unsub = coordinator.async_add_listener(_async_first_update)
+
+
+async def _async_migrate_to_device_id(hass: HomeAssistant, entry: ConfigEntry, coordinator: CozyLifeCoordinator):
+    """Re-key an IP-based entry, its device and entities on the device id from CMD_INFO."""
+    info = await coordinator.device.query_info()
+    device_id = info.get("did") if info else None
+    if not device_id:
+        _LOGGER.debug("No device id from %s, keeping IP-based identity", coordinator.ip)
+        return
+    for other in hass.config_entries.async_entries(DOMAIN):
+        if other.entry_id != entry.entry_id and other.unique_id == device_id:
+            _LOGGER.warning(
+                "Device %s at %s is already configured by another entry, keeping IP-based identity",
+                device_id, coordinator.ip,
+            )
+            return
+
+    ip = entry.data[CONF_IP_ADDRESS]
+
+    @callback
+    def _migrate_unique_id(entity_entry: er.RegistryEntry):
+        if entity_entry.unique_id.endswith(f"_{ip}"):
+            return {"new_unique_id": entity_entry.unique_id[: -len(ip)] + device_id}
+        return None
+
+    await er.async_migrate_entries(hass, entry.entry_id, _migrate_unique_id)
+
+    device_registry = dr.async_get(hass)
+    device = device_registry.async_get_device(identifiers={(DOMAIN, ip)})
+    if device is not None:
+        device_registry.async_update_device(device.id, new_identifiers={(DOMAIN, device_id)})
+
+    hass.config_entries.async_update_entry(
+        entry, unique_id=device_id, data={**entry.data, CONF_DEVICE_ID: device_id}
+    )
+    coordinator.device_id = device_id
+    _LOGGER.info("Migrated CozyLife device at %s to device id %s", ip, device_id)
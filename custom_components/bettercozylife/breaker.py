@@ -0,0 +1,104 @@
+"""Per-device circuit breaker for CozyLife plugs."""
+from __future__ import annotations
+
+import random
+import time
+from typing import Callable
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stop talking to a plug that keeps failing and probe it with growing pauses.
+
+    Closed: every request goes through; ``failure_threshold`` consecutive
+    failures open the breaker. Open: requests are refused without touching the
+    network until the backoff delay has passed. Half-open: exactly one probe is
+    let through; success closes the breaker, failure opens it again with the
+    delay doubled, jittered and capped at ``max_delay``.
+
+    The failure count doubles as the availability signal: a plug is available
+    while fewer than ``failure_threshold`` requests in a row have failed.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        base_delay: float,
+        max_delay: float,
+        jitter: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.base_delay = max(float(base_delay), 0.0)
+        self.max_delay = max(float(max_delay), self.base_delay)
+        self._jitter = max(0.0, min(float(jitter), 1.0))
+        self._clock = clock
+        self.state = STATE_CLOSED
+        self.failures = 0
+        # Times the breaker opened since it was last closed; drives the backoff
+        self.trips = 0
+        self.retry_at = 0.0
+        # Sum of all backoff delays, i.e. how long this plug has been left alone
+        self.backoff_seconds = 0.0
+
+    @property
+    def available(self) -> bool:
+        """Return True while the failure streak is below the threshold."""
+        return self.failures < self.failure_threshold
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets the next probe through."""
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(self.retry_at - self._clock(), 0.0)
+
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent now; may move open to half-open."""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN and self._clock() >= self.retry_at:
+            self.state = STATE_HALF_OPEN
+            return True
+        # Open and waiting, or half-open with the probe still out
+        return False
+
+    def is_blocking(self) -> bool:
+        """Return True if ``allow_request`` would refuse, without changing state."""
+        if self.state == STATE_OPEN:
+            return self._clock() < self.retry_at
+        return self.state == STATE_HALF_OPEN
+
+    def record_success(self) -> None:
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or (
+            self.state == STATE_CLOSED and self.failures >= self.failure_threshold
+        ):
+            self._trip()
+
+    def retry_now(self) -> None:
+        """Allow the next request immediately, e.g. after the plug moved to a new IP.
+
+        The failure streak is kept, so the plug stays unavailable until a
+        request actually succeeds.
+        """
+        if self.state != STATE_CLOSED:
+            self.state = STATE_OPEN
+            self.retry_at = self._clock()
+
+    def _trip(self) -> None:
+        self.trips += 1
+        delay = self.base_delay * 2 ** min(self.trips - 1, 32)
+        delay *= random.uniform(1.0 - self._jitter, 1.0 + self._jitter)
+        delay = min(delay, self.max_delay)
+        self.backoff_seconds += delay
+        self.state = STATE_OPEN
+        self.retry_at = self._clock() + delay
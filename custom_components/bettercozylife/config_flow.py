@@ -4,44 +4,124 @@ from __future__ import annotations
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.const import CONF_NAME, CONF_IP_ADDRESS, CONF_TIMEOUT
+from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
 from typing import Any
 import logging
 from .const import (
     DOMAIN,
     CONF_DEVICE_TYPE,
+    CONF_DEVICE_ID,
     DEVICE_TYPE_SWITCH,
     CONF_FAILURE_THRESHOLD,
     DEFAULT_FAILURE_THRESHOLD,
     CONF_RETRY_WINDOW,
     DEFAULT_TIMEOUT,
     DEFAULT_RETRY_WINDOW,
+    CONF_PUSH_MODE,
+    DEFAULT_PUSH_MODE,
+    CONF_FAST_START,
+    DEFAULT_FAST_START,
+    CONF_MIN_POLL_INTERVAL,
+    DEFAULT_MIN_POLL_INTERVAL,
+    CONF_MAX_POLL_INTERVAL,
+    DEFAULT_MAX_POLL_INTERVAL,
+    CONF_STATS_WINDOW,
+    DEFAULT_STATS_WINDOW,
+    CONF_POWER_DEADBAND,
+    CONF_CURRENT_DEADBAND,
+    CONF_VOLTAGE_DEADBAND,
+    DEFAULT_DEADBAND,
+    CONF_MAX_STATE_AGE,
+    DEFAULT_MAX_STATE_AGE,
 )
 from .cozylife_device import CozyLifeDevice
+from .discovery import async_discover_devices
+from .profiles import PROFILES
 
 _LOGGER = logging.getLogger(__name__)
 
+# Device types offered in the setup form, one per registered profile
+DEVICE_TYPES = [profile.device_type for profile in PROFILES.values()]
+
 class BetterCozyLifeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for BetterCozyLife."""
 
     VERSION = 1
 
+    def __init__(self) -> None:
+        self._discovered: dict[str, dict[str, Any]] = {}
+
     async def async_step_user(self, user_input: dict[str, Any] | None = None):
         """Handle the initial step."""
+        return self.async_show_menu(step_id="user", menu_options=["discover", "manual"])
+
+    async def async_step_discover(self, user_input: dict[str, Any] | None = None):
+        """Pick a plug found by scanning the local network."""
+        if user_input is not None:
+            ip = user_input[CONF_IP_ADDRESS]
+            info = self._discovered.get(ip, {})
+            device_id = info.get("did")
+            await self.async_set_unique_id(device_id or ip)
+            self._abort_if_unique_id_configured(updates={CONF_IP_ADDRESS: ip})
+
+            name = user_input.get(CONF_NAME) or info.get("dmn") or f"CozyLife {ip}"
+            data = {
+                CONF_IP_ADDRESS: ip,
+                CONF_DEVICE_TYPE: user_input[CONF_DEVICE_TYPE],
+                CONF_NAME: name,
+            }
+            if device_id:
+                data[CONF_DEVICE_ID] = device_id
+            return self.async_create_entry(title=name, data=data)
+
+        devices = await async_discover_devices(self.hass)
+        configured_ids = self._async_current_ids()
+        configured_ips = {
+            entry.data.get(CONF_IP_ADDRESS)
+            for entry in self._async_current_entries(include_ignore=True)
+        }
+        self._discovered = {
+            info["ip"]: info
+            for info in devices
+            if info["ip"] not in configured_ips and info.get("did") not in configured_ids
+        }
+        if not self._discovered:
+            return self.async_abort(reason="no_devices_found")
+
+        return self.async_show_form(
+            step_id="discover",
+            data_schema=vol.Schema({
+                vol.Required(CONF_IP_ADDRESS): vol.In({
+                    ip: f"{info.get('dmn') or 'CozyLife'} ({ip})"
+                    for ip, info in sorted(self._discovered.items())
+                }),
+                vol.Required(CONF_DEVICE_TYPE, default=DEVICE_TYPE_SWITCH): vol.In(DEVICE_TYPES),
+                vol.Optional(CONF_NAME): str,
+            }),
+        )
+
+    async def async_step_manual(self, user_input: dict[str, Any] | None = None):
+        """Handle manual entry of a plug's IP address."""
         errors = {}
 
         if user_input is not None:
             try:
                 # Test connection to device
                 device = CozyLifeDevice(user_input[CONF_IP_ADDRESS], timeout=DEFAULT_TIMEOUT, retry_window=DEFAULT_RETRY_WINDOW)
-                if await self.hass.async_add_executor_job(device.test_connection):
-                    # Create unique ID from IP address
-                    await self.async_set_unique_id(user_input[CONF_IP_ADDRESS])
+                info = await device.query_info()
+                if await device.test_connection():
+                    # Create unique ID from the device id, falling back to the IP address
+                    device_id = info.get("did") if info else None
+                    await self.async_set_unique_id(device_id or user_input[CONF_IP_ADDRESS])
                     self._abort_if_unique_id_configured()
-                    
+
+                    data = dict(user_input)
+                    if device_id:
+                        data[CONF_DEVICE_ID] = device_id
                     return self.async_create_entry(
                         title=user_input[CONF_NAME],
-                        data=user_input
+                        data=data
                     )
                 else:
                     errors["base"] = "cannot_connect"
@@ -51,13 +131,10 @@ class BetterCozyLifeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         # Show configuration form
         return self.async_show_form(
-            step_id="user",
+            step_id="manual",
             data_schema=vol.Schema({
                 vol.Required(CONF_IP_ADDRESS): str,
-                vol.Required(CONF_DEVICE_TYPE, default=DEVICE_TYPE_SWITCH): vol.In([
-                    DEVICE_TYPE_SWITCH
-                
-                ]),
+                vol.Required(CONF_DEVICE_TYPE, default=DEVICE_TYPE_SWITCH): vol.In(DEVICE_TYPES),
                 vol.Optional(CONF_NAME): str,
             }),
             errors=errors,
@@ -65,15 +142,18 @@ class BetterCozyLifeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def async_step_import(self, import_config):
         """Handle import from configuration.yaml."""
-        return await self.async_step_user(import_config)
+        return await self.async_step_manual(import_config)
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry):
+        """Return the options flow handler."""
+        return BetterCozyLifeOptionsFlowHandler()
 
 
 class BetterCozyLifeOptionsFlowHandler(config_entries.OptionsFlow):
     """Handle options to display and modify IP address/name."""
 
-    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
-        self.config_entry = config_entry
-
     async def async_step_init(self, user_input: dict[str, Any] | None = None):
         errors: dict[str, str] = {}
 
@@ -81,6 +161,15 @@ class BetterCozyLifeOptionsFlowHandler(config_entries.OptionsFlow):
             new_ip = user_input.get(CONF_IP_ADDRESS, self.config_entry.data.get(CONF_IP_ADDRESS))
             new_name = user_input.get(CONF_NAME, self.config_entry.title)
             failure_threshold = user_input.get(CONF_FAILURE_THRESHOLD, self.config_entry.options.get(CONF_FAILURE_THRESHOLD, DEFAULT_FAILURE_THRESHOLD))
+            push_mode = user_input.get(CONF_PUSH_MODE, self.config_entry.options.get(CONF_PUSH_MODE, DEFAULT_PUSH_MODE))
+            fast_start = user_input.get(CONF_FAST_START, self.config_entry.options.get(CONF_FAST_START, DEFAULT_FAST_START))
+            min_poll = float(user_input.get(CONF_MIN_POLL_INTERVAL, self.config_entry.options.get(CONF_MIN_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL)))
+            max_poll = float(user_input.get(CONF_MAX_POLL_INTERVAL, self.config_entry.options.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL)))
+            stats_window = float(user_input.get(CONF_STATS_WINDOW, self.config_entry.options.get(CONF_STATS_WINDOW, DEFAULT_STATS_WINDOW)))
+            power_deadband = float(user_input.get(CONF_POWER_DEADBAND, self.config_entry.options.get(CONF_POWER_DEADBAND, DEFAULT_DEADBAND)))
+            current_deadband = float(user_input.get(CONF_CURRENT_DEADBAND, self.config_entry.options.get(CONF_CURRENT_DEADBAND, DEFAULT_DEADBAND)))
+            voltage_deadband = float(user_input.get(CONF_VOLTAGE_DEADBAND, self.config_entry.options.get(CONF_VOLTAGE_DEADBAND, DEFAULT_DEADBAND)))
+            max_state_age = float(user_input.get(CONF_MAX_STATE_AGE, self.config_entry.options.get(CONF_MAX_STATE_AGE, DEFAULT_MAX_STATE_AGE)))
 
             # Validate connectivity to new IP
             try:
@@ -88,11 +177,13 @@ class BetterCozyLifeOptionsFlowHandler(config_entries.OptionsFlow):
                 retry_window = float(user_input.get(CONF_RETRY_WINDOW, self.config_entry.options.get(CONF_RETRY_WINDOW, DEFAULT_RETRY_WINDOW)))
 
                 device = CozyLifeDevice(new_ip, timeout=timeout, retry_window=retry_window)
-                ok = await self.hass.async_add_executor_job(device.test_connection)
-                if not ok:
+                if min_poll > max_poll:
+                    errors["base"] = "invalid_poll_interval"
+                elif not await device.test_connection():
                     errors["base"] = "cannot_connect"
                 else:
-                    # Update entry data/options
+                    # IP and name live in the entry data; the options are saved by
+                    # finishing the flow, and the entry's update listener reloads it
                     new_data = dict(self.config_entry.data)
                     new_data[CONF_IP_ADDRESS] = new_ip
                     if new_name:
@@ -103,18 +194,23 @@ class BetterCozyLifeOptionsFlowHandler(config_entries.OptionsFlow):
                     new_options[CONF_FAILURE_THRESHOLD] = int(failure_threshold)
                     new_options[CONF_TIMEOUT] = timeout
                     new_options[CONF_RETRY_WINDOW] = retry_window
+                    new_options[CONF_PUSH_MODE] = bool(push_mode)
+                    new_options[CONF_FAST_START] = bool(fast_start)
+                    new_options[CONF_MIN_POLL_INTERVAL] = min_poll
+                    new_options[CONF_MAX_POLL_INTERVAL] = max_poll
+                    new_options[CONF_STATS_WINDOW] = stats_window
+                    new_options[CONF_POWER_DEADBAND] = power_deadband
+                    new_options[CONF_CURRENT_DEADBAND] = current_deadband
+                    new_options[CONF_VOLTAGE_DEADBAND] = voltage_deadband
+                    new_options[CONF_MAX_STATE_AGE] = max_state_age
 
-                    await self.hass.config_entries.async_update_entry(
+                    self.hass.config_entries.async_update_entry(
                         self.config_entry,
                         title=new_name if new_name else self.config_entry.title,
                         data=new_data,
-                        options=new_options,
                     )
 
-                    # Reload entry to apply changes (restart coordinator)
-                    await self.hass.config_entries.async_reload(self.config_entry.entry_id)
-
-                    return self.async_create_entry(title="", data={})
+                    return self.async_create_entry(title="", data=new_options)
             except Exception as e:
                 _LOGGER.error("Error validating new IP %s: %s", new_ip, e)
                 errors["base"] = "cannot_connect"
@@ -146,11 +242,44 @@ class BetterCozyLifeOptionsFlowHandler(config_entries.OptionsFlow):
                         CONF_RETRY_WINDOW,
                         default=current_retry,
                     ): vol.All(vol.Coerce(float), vol.Range(min=0, max=600)),
+                    vol.Required(
+                        CONF_MIN_POLL_INTERVAL,
+                        default=current_options.get(CONF_MIN_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=1, max=3600)),
+                    vol.Required(
+                        CONF_MAX_POLL_INTERVAL,
+                        default=current_options.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=1, max=3600)),
+                    vol.Required(
+                        CONF_STATS_WINDOW,
+                        default=current_options.get(CONF_STATS_WINDOW, DEFAULT_STATS_WINDOW),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=10, max=86400)),
+                    vol.Required(
+                        CONF_POWER_DEADBAND,
+                        default=current_options.get(CONF_POWER_DEADBAND, DEFAULT_DEADBAND),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=1000)),
+                    vol.Required(
+                        CONF_CURRENT_DEADBAND,
+                        default=current_options.get(CONF_CURRENT_DEADBAND, DEFAULT_DEADBAND),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=16)),
+                    vol.Required(
+                        CONF_VOLTAGE_DEADBAND,
+                        default=current_options.get(CONF_VOLTAGE_DEADBAND, DEFAULT_DEADBAND),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=50)),
+                    vol.Required(
+                        CONF_MAX_STATE_AGE,
+                        default=current_options.get(CONF_MAX_STATE_AGE, DEFAULT_MAX_STATE_AGE),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=10, max=86400)),
+                    vol.Required(
+                        CONF_PUSH_MODE,
+                        default=current_options.get(CONF_PUSH_MODE, DEFAULT_PUSH_MODE),
+                    ): bool,
+                    vol.Required(
+                        CONF_FAST_START,
+                        default=current_options.get(CONF_FAST_START, DEFAULT_FAST_START),
+                    ): bool,
                 }
             ),
             errors=errors,
         )
 
-
-async def async_get_options_flow(config_entry: config_entries.ConfigEntry):
-    return BetterCozyLifeOptionsFlowHandler(config_entry)
@@ -0,0 +1,246 @@
+"""Persistent, pipelined connection to a CozyLife device."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from .metrics import DeviceMetrics
+from .protocol import LineFramer, decode_message, encode_command
+from .trace import (
+    EVENT_CLOSE,
+    EVENT_CONNECT_FAIL,
+    EVENT_EOF,
+    EVENT_OPEN,
+    EVENT_RESET,
+    EVENT_RX,
+    EVENT_TX,
+    TraceRecorder,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 4096
+
+
+class CozyLifeConnection:
+    """One long-lived stream to a plug with replies matched to requests by ``sn``.
+
+    Several requests may be outstanding at once. A background reader parses
+    every line the device sends and resolves the future of the request whose
+    ``sn`` it carries; anything that does not belong to a pending request is
+    handed to ``on_message`` instead of being mistaken for a reply.
+
+    With a ``recorder`` every connect, sent frame and received chunk is added
+    to its trace; ``open_connection`` replaces ``asyncio.open_connection``,
+    e.g. with a ``TraceReplayer`` serving a recorded trace. ``on_close`` is
+    called with the connection once it is closed by either side.
+    """
+
+    def __init__(
+        self,
+        ip: str,
+        port: int,
+        on_message: Optional[Callable[[Dict[str, Any]], None]] = None,
+        metrics: Optional[DeviceMetrics] = None,
+        recorder: Optional[TraceRecorder] = None,
+        open_connection: Optional[Callable[..., Awaitable[Any]]] = None,
+        on_close: Optional[Callable[[CozyLifeConnection], None]] = None,
+    ) -> None:
+        self.ip = ip
+        self.port = port
+        self._on_message = on_message
+        self._metrics = metrics or DeviceMetrics()
+        self._recorder = recorder
+        self._open_connection = open_connection or asyncio.open_connection
+        self._on_close = on_close
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+        # Pending sns per command, oldest first, for replies that omit the sn
+        self._pending_by_cmd: Dict[Any, Deque[str]] = {}
+
+    @property
+    def connected(self) -> bool:
+        """Return True while the stream is open and being read."""
+        return self._writer is not None and not self._writer.is_closing()
+
+    @property
+    def busy(self) -> bool:
+        """Return True while a request is waiting for its reply."""
+        return bool(self._pending)
+
+    def set_keepalive(self, idle: int, interval: int = 10, count: int = 3) -> None:
+        """Let the OS probe the idle stream so a vanished plug is noticed."""
+        sock = self._writer.get_extra_info("socket") if self._writer is not None else None
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # Not every platform has the finer timers
+            for option, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        except OSError as err:
+            _LOGGER.debug("Could not enable keepalive for %s: %s", self.ip, err)
+
+    async def async_connect(self, timeout: float) -> None:
+        """Open the stream and start the reader; raises on failure."""
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                self._open_connection(self.ip, self.port), timeout
+            )
+        except Exception:
+            if self._recorder is not None:
+                self._recorder.record(EVENT_CONNECT_FAIL)
+            raise
+        if self._recorder is not None:
+            self._recorder.record(EVENT_OPEN)
+        self._read_task = asyncio.get_running_loop().create_task(self._async_read_loop())
+
+    async def async_request(self, command: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        """Send a command and wait for the reply carrying the same sn.
+
+        Returns None when no matching reply arrives within ``timeout``. Raises
+        ConnectionError if the stream is closed before or while waiting.
+        """
+        return await self.async_request_encoded(
+            command.get("cmd"), str(command["sn"]), encode_command(command), timeout
+        )
+
+    async def async_request_encoded(
+        self, cmd: Any, sn: str, payload: bytes, timeout: float
+    ) -> Optional[Dict[str, Any]]:
+        """Like ``async_request`` for a command already serialized to ``payload``."""
+        if not self.connected:
+            raise ConnectionError(f"Not connected to {self.ip}")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[sn] = future
+        self._pending_by_cmd.setdefault(cmd, deque()).append(sn)
+        try:
+            async with self._write_lock:
+                self._writer.write(payload)
+                if self._recorder is not None:
+                    self._recorder.record(EVENT_TX, payload)
+                await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            _LOGGER.debug("No reply from %s for sn %s within %.1fs", self.ip, sn, timeout)
+            return None
+        finally:
+            self._forget(sn, cmd)
+
+    async def async_close(self) -> None:
+        """Close the stream, stop the reader and fail outstanding requests."""
+        writer = self._writer
+        self.close()
+        if writer is not None:
+            try:
+                await asyncio.wait_for(writer.wait_closed(), 1)
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """Close the stream without waiting for it to finish closing."""
+        if self._writer is not None:
+            if self._recorder is not None and self._read_task is not asyncio.current_task():
+                self._recorder.record(EVENT_CLOSE)
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        self._reader = None
+        self._writer = None
+        task, self._read_task = self._read_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        self._fail_pending(ConnectionError(f"Connection to {self.ip} closed"))
+        if self._on_close is not None:
+            self._on_close(self)
+
+    def _forget(self, sn: str, cmd: Any) -> None:
+        self._pending.pop(sn, None)
+        queue = self._pending_by_cmd.get(cmd)
+        if queue is not None:
+            try:
+                queue.remove(sn)
+            except ValueError:
+                pass
+            if not queue:
+                self._pending_by_cmd.pop(cmd, None)
+
+    def _fail_pending(self, err: Exception) -> None:
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(err)
+
+    async def _async_read_loop(self) -> None:
+        reader = self._reader
+        framer = LineFramer()
+        try:
+            while True:
+                chunk = await reader.read(READ_CHUNK_SIZE)
+                if self._recorder is not None:
+                    self._recorder.record(EVENT_RX if chunk else EVENT_EOF, chunk)
+                if not chunk:
+                    _LOGGER.debug("Connection closed by %s", self.ip)
+                    break
+                dropped = framer.invalid_lines + framer.overflows
+                for line in framer.feed(chunk):
+                    self._handle_line(line)
+                dropped = framer.invalid_lines + framer.overflows - dropped
+                if dropped:
+                    self._metrics.record_invalid_message(dropped)
+        except asyncio.CancelledError:
+            raise
+        except ConnectionResetError:
+            _LOGGER.debug("Connection reset by %s", self.ip)
+            if self._recorder is not None:
+                self._recorder.record(EVENT_RESET)
+        except Exception as err:
+            _LOGGER.debug("Error reading from %s: %s", self.ip, err)
+        # Only reached when the stream ended without us closing it
+        self._metrics.record_reset()
+        self.close()
+
+    def _handle_line(self, line: str) -> None:
+        if not line:
+            return
+        try:
+            message = decode_message(line)
+        except ValueError:
+            _LOGGER.debug(
+                "Received invalid JSON from %s, skipping. Length: %d chars", self.ip, len(line)
+            )
+            self._metrics.record_invalid_message()
+            return
+        if not isinstance(message, dict):
+            return
+        self._dispatch(message)
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        sn = message.get("sn")
+        future = self._pending.get(str(sn)) if sn is not None else None
+        if future is None and sn is None:
+            # Some firmware omits the sn; fall back to the oldest request of that command
+            queue = self._pending_by_cmd.get(message.get("cmd"))
+            if queue:
+                future = self._pending.get(queue.popleft())
+
+        if future is not None:
+            if not future.done():
+                future.set_result(message)
+            return
+
+        if self._on_message is not None:
+            try:
+                self._on_message(message)
+            except Exception as err:
+                _LOGGER.debug("Message handler for %s failed: %s", self.ip, err)
+        else:
+            _LOGGER.debug("Ignoring unsolicited message from %s: %s", self.ip, message)
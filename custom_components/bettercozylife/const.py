@@ -6,6 +6,8 @@ DOMAIN = "bettercozylife"
 CONF_DEVICES = "devices"
 CONF_DEVICE_IP = CONF_IP_ADDRESS
 CONF_DEVICE_TYPE = CONF_TYPE
+# Stable device id ("did") reported by CMD_INFO
+CONF_DEVICE_ID = "device_id"
 
 DEVICE_TYPE_SWITCH = "switch"
 
@@ -16,9 +18,113 @@ CMD_INFO = 0
 CMD_QUERY = 2
 CMD_SET = 3
 
+# Attribute ids ("dpid") of the state the integration reads
+DPID_SWITCH = 1
+DPID_CURRENT = 27
+DPID_POWER = 28
+DPID_VOLTAGE = 29
+STATE_DPIDS = (DPID_SWITCH, DPID_CURRENT, DPID_POWER, DPID_VOLTAGE)
+# Attribute ids a device reported at setup, cached in the entry data
+CONF_CAPABILITIES = "capabilities"
+
 # Options
 CONF_FAILURE_THRESHOLD = "failure_threshold"
 DEFAULT_FAILURE_THRESHOLD = 5
+# First circuit breaker backoff; doubles per failed probe up to the max delay
 CONF_RETRY_WINDOW = "retry_window"
 DEFAULT_TIMEOUT = 3
 DEFAULT_RETRY_WINDOW = 10
+BREAKER_MAX_DELAY = 300
+BREAKER_JITTER = 0.2
+
+# Polling
+DEFAULT_POLL_INTERVAL = 10
+# Fraction of the interval each poll is randomly shifted by
+POLL_JITTER = 0.1
+DEFAULT_MAX_CONCURRENT_POLLS = 16
+
+# Adaptive polling: fast while the load is active, backing off while flat
+CONF_MIN_POLL_INTERVAL = "min_poll_interval"
+DEFAULT_MIN_POLL_INTERVAL = 5
+CONF_MAX_POLL_INTERVAL = "max_poll_interval"
+DEFAULT_MAX_POLL_INTERVAL = 120
+POLL_BACKOFF_FACTOR = 1.5
+# A power change above max(delta, ratio * reading) counts as activity
+ACTIVITY_POWER_DELTA = 2.0
+ACTIVITY_POWER_RATIO = 0.05
+
+# Push mode: listen for state reports and only poll as a heartbeat
+CONF_PUSH_MODE = "push_mode"
+DEFAULT_PUSH_MODE = False
+DEFAULT_PUSH_HEARTBEAT = 60
+
+# Energy: a gap between power samples longer than this many (maximum) poll
+# intervals is not integrated, since the load during it is unknown
+ENERGY_MAX_GAP_INTERVALS = 3
+
+# State write filtering: a power/current/voltage sensor only writes a new state
+# when its reading moves by at least the deadband or the last write is older
+# than the max age. A deadband of 0 writes every change.
+CONF_POWER_DEADBAND = "power_deadband"
+CONF_CURRENT_DEADBAND = "current_deadband"
+CONF_VOLTAGE_DEADBAND = "voltage_deadband"
+DEFAULT_DEADBAND = 0.0
+CONF_MAX_STATE_AGE = "max_state_age"
+DEFAULT_MAX_STATE_AGE = 300
+
+# Rolling statistics over an in-memory sample history
+CONF_STATS_WINDOW = "stats_window"
+DEFAULT_STATS_WINDOW = 300
+# Upper bound on samples kept per plug; the buffer is sized for two samples per
+# minimum poll interval across the window
+SAMPLE_BUFFER_MAX = 2048
+SAMPLE_BUFFER_MIN = 64
+
+# LAN discovery
+DISCOVERY_CONNECT_TIMEOUT = 1.0
+DISCOVERY_MAX_CONCURRENT = 64
+DISCOVERY_CACHE_TTL = 300
+# Networks larger than this are narrowed to the /24 around our own address
+DISCOVERY_MIN_PREFIX = 24
+
+# IP re-resolution: look the device id up on the LAN when a plug stops answering
+RERESOLVE_AFTER_FAILURES = 3
+RERESOLVE_COOLDOWN = 60
+# Each scan that does not find the plug doubles the wait before the next one, up to this
+RERESOLVE_MAX_COOLDOWN = 3600
+# Another plug's scan younger than this is reused instead of scanning again
+RERESOLVE_MAX_SCAN_AGE = 30
+
+# Fired when an optimistic switch state is contradicted by the device
+EVENT_OPTIMISTIC_ROLLBACK = f"{DOMAIN}_optimistic_rollback"
+
+# Services
+SERVICE_SET_MANY = "set_many"
+ATTR_STATE = "state"
+ATTR_MAX_CONCURRENCY = "max_concurrency"
+DEFAULT_SET_MANY_CONCURRENCY = 16
+SERVICE_TRACE = "trace"
+ATTR_DURATION = "duration"
+DEFAULT_TRACE_DURATION = 60
+MAX_TRACE_DURATION = 3600
+
+# Protocol traces: directory under the config dir, and events kept per trace
+TRACE_DIR = "bettercozylife_traces"
+TRACE_MAX_EVENTS = 200_000
+
+# Connection pool shared by all plugs: open sockets at most, seconds before
+# an idle connection is closed, and seconds idle before TCP keepalive probes
+DEFAULT_POOL_MAX_OPEN = 128
+DEFAULT_POOL_IDLE_TIMEOUT = 60
+POOL_KEEPALIVE_IDLE = 30
+
+# Fast start: set up entities from restored state and poll for the first
+# time in the background instead of during setup
+CONF_FAST_START = "fast_start"
+DEFAULT_FAST_START = True
+
+# hass.data[DOMAIN] keys that are not config entry ids
+DATA_SCHEDULER = "scheduler"
+DATA_POOL = "pool"
+DATA_BOOT = "boot"
+DATA_DISCOVERY = "discovery"
@@ -1,30 +1,60 @@
 """Update coordinator for BetterCozyLife devices."""
 from __future__ import annotations
 
-from datetime import timedelta
 import asyncio
 import async_timeout
 import logging
-from typing import Any, Dict
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
     CONF_IP_ADDRESS,
 )
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
     UpdateFailed,
 )
 
 from .cozylife_device import CozyLifeDevice
+from .discovery import async_find_device
+from .energy import EnergyAccumulator
+from .pool import CozyLifeConnectionPool
+from .profiles import DeviceProfile, get_profile
+from .samples import SampleRing
+from .scheduler import AdaptivePollInterval
+from .trace import TraceRecorder
 from .const import (
+    DOMAIN,
     CONF_FAILURE_THRESHOLD,
     DEFAULT_FAILURE_THRESHOLD,
     CONF_TIMEOUT,
     DEFAULT_TIMEOUT,
     CONF_RETRY_WINDOW,
     DEFAULT_RETRY_WINDOW,
+    CONF_MIN_POLL_INTERVAL,
+    DEFAULT_MIN_POLL_INTERVAL,
+    CONF_MAX_POLL_INTERVAL,
+    DEFAULT_MAX_POLL_INTERVAL,
+    CONF_PUSH_MODE,
+    DEFAULT_PUSH_MODE,
+    DEFAULT_PUSH_HEARTBEAT,
+    ENERGY_MAX_GAP_INTERVALS,
+    CONF_STATS_WINDOW,
+    DEFAULT_STATS_WINDOW,
+    SAMPLE_BUFFER_MAX,
+    SAMPLE_BUFFER_MIN,
+    CONF_DEVICE_ID,
+    CONF_DEVICE_TYPE,
+    CONF_CAPABILITIES,
+    RERESOLVE_AFTER_FAILURES,
+    RERESOLVE_COOLDOWN,
+    RERESOLVE_MAX_COOLDOWN,
+    RERESOLVE_MAX_SCAN_AGE,
+    EVENT_OPTIMISTIC_ROLLBACK,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -33,10 +63,17 @@ _LOGGER = logging.getLogger(__name__)
 class CozyLifeCoordinator(DataUpdateCoordinator[Dict[str, Any]]):
     """Coordinator to manage CozyLife device state and availability."""
 
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry):
+    def __init__(
+        self, hass: HomeAssistant, entry: ConfigEntry, pool: Optional[CozyLifeConnectionPool] = None
+    ):
         self.hass = hass
         self.entry = entry
         self.ip = entry.data[CONF_IP_ADDRESS]
+        self.device_id = entry.data.get(CONF_DEVICE_ID)
+        self.profile: DeviceProfile = get_profile(entry.data[CONF_DEVICE_TYPE])
+        self._reresolve_task: asyncio.Task | None = None
+        self._last_reresolve = 0.0
+        self._reresolve_cooldown = float(RERESOLVE_COOLDOWN)
         try:
             self.socket_timeout = float(entry.options.get(CONF_TIMEOUT, DEFAULT_TIMEOUT))
         except (TypeError, ValueError):
@@ -45,64 +82,423 @@ class CozyLifeCoordinator(DataUpdateCoordinator[Dict[str, Any]]):
             self.retry_window = float(entry.options.get(CONF_RETRY_WINDOW, DEFAULT_RETRY_WINDOW))
         except (TypeError, ValueError):
             self.retry_window = float(DEFAULT_RETRY_WINDOW)
-        self.device = CozyLifeDevice(self.ip, timeout=self.socket_timeout, retry_window=self.retry_window)
-        self.consecutive_failures = 0
         # Read from options, fallback to default
         self.failure_threshold = entry.options.get(CONF_FAILURE_THRESHOLD, DEFAULT_FAILURE_THRESHOLD)
+        # The device's circuit breaker counts failures for availability and backoff alike
+        self.device = CozyLifeDevice(
+            self.ip,
+            timeout=self.socket_timeout,
+            retry_window=self.retry_window,
+            failure_threshold=self.failure_threshold,
+            pool=pool,
+        )
+        # Attribute ids the plug has; None until probed, which assumes every attribute
+        self.capabilities: Optional[List[int]] = entry.data.get(CONF_CAPABILITIES)
+        self.device.set_query_attributes(self._query_attributes())
         self._request_timeout = max(self.socket_timeout + 2, self.socket_timeout * 2, 5)
+        self._interval = AdaptivePollInterval(
+            entry.options.get(CONF_MIN_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL),
+            entry.options.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL),
+            relay_keys=self.profile.switch_keys,
+            power_key=self.profile.power_key,
+        )
+        # The longest regular wait between samples is the max poll interval or the push heartbeat
+        self.energy = EnergyAccumulator(
+            ENERGY_MAX_GAP_INTERVALS * max(self._interval.max_interval, DEFAULT_PUSH_HEARTBEAT)
+        )
+        try:
+            self.stats_window = float(entry.options.get(CONF_STATS_WINDOW, DEFAULT_STATS_WINDOW))
+        except (TypeError, ValueError):
+            self.stats_window = float(DEFAULT_STATS_WINDOW)
+        self.push_mode = bool(entry.options.get(CONF_PUSH_MODE, DEFAULT_PUSH_MODE))
+        # Pushes can arrive faster than any poll, so pushed plugs get the largest ring
+        self.samples = SampleRing(SAMPLE_BUFFER_MAX if self.push_mode else min(
+            max(math.ceil(2 * self.stats_window / self._interval.min_interval), SAMPLE_BUFFER_MIN),
+            SAMPLE_BUFFER_MAX,
+        ), self.profile.sampled_keys)
+        # Samples closer together than this are left out of the ring, so that
+        # it always spans the whole statistics window
+        self._sample_spacing = self.stats_window / self.samples.capacity
+        self._last_ring_sample = -math.inf
+        # Statistics per field, computed on first use after each sample, with
+        # the loop time at which their oldest sample leaves the window
+        self._stats_cache: Dict[str, Tuple[float, Optional[Dict[str, float]]]] = {}
+        # Relay states set optimistically and not yet confirmed by the device:
+        # key -> (expected state, state before the command, loop time it was set)
+        self._pending: Dict[str, Tuple[bool, Optional[bool], float]] = {}
+        # Entity id -> relay key of this plug's switch entities, kept up to date by the entities
+        self.switch_entities: Dict[str, str] = {}
+        # Path and stop timer of the running protocol trace
+        self._trace: Optional[Tuple[str, CALLBACK_TYPE]] = None
+        if self.push_mode:
+            self.device.message_callback = self._handle_push
+            # Pushes only arrive on an open connection
+            self.device.keep_connection = True
 
+        # No update_interval: polling is driven by the shared CozyLifePollScheduler
         super().__init__(
             hass,
             _LOGGER,
             name=f"BetterCozyLife {self.ip}",
-            update_interval=timedelta(seconds=10),  # Align to 10s
         )
 
+    @property
+    def identity(self) -> str:
+        """Stable key for unique ids: the device id, or the IP for legacy entries."""
+        return self.device_id or self.ip
+
+    @property
+    def poll_interval(self) -> float:
+        """Seconds the scheduler should wait between polls of this device."""
+        # While pushes can arrive, polling is only a heartbeat; without an open
+        # connection the adaptive cadence applies so it is reopened quickly.
+        if self.push_mode and self.device.connected:
+            return float(DEFAULT_PUSH_HEARTBEAT)
+        # A dead plug is only polled when its breaker is ready to let a probe through
+        if self.device.is_backing_off():
+            return max(self.device.breaker.retry_in, 1.0)
+        return self._interval.value
+
+    async def async_shutdown(self) -> None:
+        """Cancel any scheduled refresh and close the device connection."""
+        await super().async_shutdown()
+        if self._reresolve_task is not None:
+            self._reresolve_task.cancel()
+        # Keep what a trace recorded so far rather than losing it with the entry
+        await self.async_stop_trace()
+        await self.device.close()
+
+    async def async_start_trace(self, path: str, duration: float) -> None:
+        """Record the plug's traffic for ``duration`` seconds into ``path``.
+
+        A trace already running is saved first.
+        """
+        await self.async_stop_trace()
+        await self.device.start_trace()
+
+        async def _async_finish(_now: Any) -> None:
+            await self.async_stop_trace()
+
+        self._trace = (path, async_call_later(self.hass, duration, _async_finish))
+        _LOGGER.info("Tracing %s for %ss into %s", self.ip, duration, path)
+
+    async def async_stop_trace(self) -> Optional[str]:
+        """Stop the running trace and save it; returns its path."""
+        if self._trace is None:
+            return None
+        (path, cancel_timer), self._trace = self._trace, None
+        cancel_timer()
+        recorder = await self.device.stop_trace()
+        if recorder is None:
+            return None
+        await self.hass.async_add_executor_job(self._save_trace, recorder, path)
+        _LOGGER.info(
+            "Saved trace of %s with %d events to %s%s", self.ip, len(recorder.events), path,
+            " (truncated)" if recorder.truncated else "",
+        )
+        return path
+
+    @staticmethod
+    def _save_trace(recorder: TraceRecorder, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        recorder.save(path)
+
+    @property
+    def consecutive_failures(self) -> int:
+        """Failed device requests in a row, as counted by the circuit breaker."""
+        return self.device.breaker.failures
+
     @property
     def coordinator_available(self) -> bool:
         """Availability with failure threshold considered."""
-        return self.consecutive_failures < self.failure_threshold
+        return self.device.breaker.available
+
+    def supports(self, dpid: int) -> bool:
+        """Return True if the plug has attribute ``dpid``, or its capabilities are unknown."""
+        return self.capabilities is None or dpid in self.capabilities
+
+    def _query_attributes(self) -> List[int]:
+        """State attributes to poll: the relays, plus whatever else the plug has."""
+        relays = self.profile.relay_dpids
+        return [dpid for dpid in self.profile.state_dpids if dpid in relays or self.supports(dpid)]
+
+    async def async_probe_capabilities(self) -> None:
+        """Find out which attributes the plug has and cache them in the entry.
+
+        Runs once per entry; if the plug does not answer, every attribute is
+        assumed and the probe is repeated on the next setup.
+        """
+        try:
+            capabilities = await self.device.probe_capabilities()
+        except Exception as err:
+            _LOGGER.debug("Capability probe failed for %s: %s", self.ip, err)
+            capabilities = None
+        if not capabilities:
+            _LOGGER.debug("No capabilities from %s, assuming all attributes", self.ip)
+            return
+        _LOGGER.debug("CozyLife device at %s has attributes %s", self.ip, capabilities)
+        self.capabilities = capabilities
+        self.device.set_query_attributes(self._query_attributes())
+        self.hass.config_entries.async_update_entry(
+            self.entry, data={**self.entry.data, CONF_CAPABILITIES: capabilities}
+        )
 
     async def _async_update_data(self) -> Dict[str, Any]:
         """Fetch data from device."""
+        # While the breaker is open nothing would be sent: keep the last known data
+        if self.device.is_backing_off():
+            _LOGGER.debug("Coordinator skipping update for %s, circuit breaker is open", self.ip)
+            if self.data is not None:
+                return self.data
+            raise UpdateFailed("No data and no previous state while the circuit breaker is open")
+
+        started = self.hass.loop.time()
         try:
             async with async_timeout.timeout(self._request_timeout):
-                state = await self.hass.async_add_executor_job(self.device.query_state)
+                state = await self.device.query_state()
         except (asyncio.TimeoutError, Exception) as err:
+            # The device has already reported the failure to its breaker
             _LOGGER.debug("Coordinator update error for %s: %s", self.ip, err)
-            self.consecutive_failures += 1
+            self._poll_failed()
             raise UpdateFailed(f"Update failed: {err}") from err
 
         if state is None:
-            # During backoff, keep last known data and do not count as a failure
-            if hasattr(self.device, "is_backing_off") and self.device.is_backing_off():
-                _LOGGER.debug("Coordinator skipping update for %s due to connection backoff", self.ip)
-                # Keep failure count unchanged during backoff
-                if self.data is not None:
-                    return self.data
-                # If no previous data, treat as failure
-                self.consecutive_failures += 1
-                raise UpdateFailed("No data and no previous state during backoff")
-
-            # Not backing off: count as a failure
-            self.consecutive_failures += 1
+            self._poll_failed()
             raise UpdateFailed("No data returned from device")
 
-        # Successful update
-        self.consecutive_failures = 0
-
         try:
-            result = {
-                "switch": state.get("1", 0) > 0,
-                "current": float(state.get("27", 0)) / 1000.0,
-                "power": float(state.get("28", 0)),
-                "voltage": float(state.get("29", 0)),
-                "raw": state,
-            }
+            result = self.profile.decode(state)
         except Exception as parse_err:
             _LOGGER.debug("Parsing state failed for %s: %s", self.ip, parse_err)
             # Treat this as a failure to be safe
-            self.consecutive_failures += 1
+            self.device.breaker.record_failure()
+            self._poll_failed()
             raise UpdateFailed(f"Parse failed: {parse_err}") from parse_err
 
+        result = self._reconcile_switch(result, started, "poll")
+        self._record_sample(result)
+        self._interval.observe(self.data, result)
+        self.device.metrics.record_poll(True)
+        self._reresolve_cooldown = float(RERESOLVE_COOLDOWN)
         return result
+
+    def _poll_failed(self) -> None:
+        """Count a failed poll and start looking for the plug if it keeps failing."""
+        self.device.metrics.record_poll(False)
+        if (
+            self.device_id
+            and self.consecutive_failures >= RERESOLVE_AFTER_FAILURES
+            and self._reresolve_task is None
+            and self.hass.loop.time() - self._last_reresolve >= self._reresolve_cooldown
+        ):
+            self._last_reresolve = self.hass.loop.time()
+            self._reresolve_task = self.hass.async_create_background_task(
+                self._async_reresolve(), f"bettercozylife re-resolve {self.device_id}"
+            )
+
+    async def _async_reresolve(self) -> None:
+        """Scan the LAN for our device id and switch to its new IP without a reload.
+
+        A plug that is just unplugged would otherwise be scanned for every
+        cooldown forever, so each scan that does not find it doubles the
+        cooldown until a poll succeeds again. Plugs of other entries that are
+        answering are not probed, which spares their few socket slots.
+        """
+        # Doubled up front, so a failed scan counts as well
+        self._reresolve_cooldown = min(self._reresolve_cooldown * 2, RERESOLVE_MAX_COOLDOWN)
+        healthy = [
+            other.ip
+            for other in self.hass.data.get(DOMAIN, {}).values()
+            if isinstance(other, CozyLifeCoordinator)
+            and other is not self
+            and other.last_update_success
+            and other.consecutive_failures == 0
+        ]
+        try:
+            new_ip = await async_find_device(self.hass, self.device_id, RERESOLVE_MAX_SCAN_AGE, healthy)
+            if new_ip is None or new_ip == self.ip:
+                _LOGGER.debug(
+                    "Re-resolve for %s (%s) found no new address, next scan in %.0fs at the earliest",
+                    self.device_id, self.ip, self._reresolve_cooldown,
+                )
+                return
+
+            _LOGGER.info("CozyLife device %s moved from %s to %s", self.device_id, self.ip, new_ip)
+            self.ip = new_ip
+            await self.device.change_ip(new_ip)
+            self.hass.config_entries.async_update_entry(
+                self.entry, data={**self.entry.data, CONF_IP_ADDRESS: new_ip}
+            )
+            await self.async_request_refresh()
+        except Exception as err:
+            _LOGGER.debug("Re-resolve for %s failed: %s", self.device_id, err)
+        finally:
+            self._reresolve_task = None
+
+    def _record_sample(self, result: Dict[str, Any]) -> None:
+        """Feed a fresh reading to the energy total and the rolling statistics."""
+        now = self.hass.loop.time()
+        energy_key = self.profile.energy_key
+        if energy_key is not None and result.get(energy_key) is not None:
+            result["energy"] = self.energy.add_sample(result[energy_key], now)
+        values = [result.get(key) for key in self.samples.fields]
+        if all(value is None for value in values):
+            # A relay-only plug has nothing to summarise
+            return
+        if now - self._last_ring_sample < self._sample_spacing:
+            return
+        self._last_ring_sample = now
+        self.samples.append(now, [math.nan if value is None else value for value in values])
+        self._stats_cache.clear()
+
+    def rolling_stats(self, field: str) -> Optional[Dict[str, float]]:
+        """Min, max, mean and p95 of ``field`` over the statistics window.
+
+        Computed lazily so plugs without enabled statistics sensors pay nothing,
+        and again once a sample has left the window, even if no new one came.
+        """
+        now = self.hass.loop.time()
+        cached = self._stats_cache.get(field)
+        if cached is None or now >= cached[0]:
+            oldest = self.samples.oldest(now, self.stats_window)
+            cached = self._stats_cache[field] = (
+                math.inf if oldest is None else oldest + self.stats_window,
+                self.samples.summary(field, now, self.stats_window),
+            )
+        return cached[1]
+
+    def _handle_push(self, message: Dict[str, Any]) -> None:
+        """Apply a state report the device sent on its own."""
+        msg = message.get("msg")
+        data = msg.get("data") if isinstance(msg, dict) else None
+        if not isinstance(data, dict) or not data:
+            _LOGGER.debug("Ignoring push without state from %s: %s", self.ip, message)
+            return
+
+        # Reports may carry only the attributes that changed
+        raw = dict((self.data or {}).get("raw", {}))
+        raw.update(data)
+        try:
+            result = self.profile.decode(raw)
+        except Exception as parse_err:
+            _LOGGER.debug("Parsing push failed for %s: %s", self.ip, parse_err)
+            return
+
+        # Relays the report does not carry keep their current state, which can be
+        # newer than the last raw report after a switch was set
+        if self.data:
+            for key in self.profile.switch_keys:
+                if str(self.profile.dpid(key)) not in data and key in self.data:
+                    result[key] = self.data[key]
+
+        # A report proves the plug is alive just as well as a reply does
+        self.device.breaker.record_success()
+        result = self._reconcile_switch(result, self.hass.loop.time(), "push", data)
+        self._record_sample(result)
+        self._interval.observe(self.data, result)
+        self.async_set_updated_data(result)
+
+    async def async_set_switch(self, state: bool, key: str = "switch") -> bool:
+        """Switch a relay optimistically and settle it from the SET reply.
+
+        Returns True if the device acknowledged the command.
+        """
+        dpid = self.profile.dpid(key)
+        self.async_set_switch_optimistic(state, key)
+        try:
+            reply = await self.device.set_state(state, dpid)
+        except Exception as err:
+            _LOGGER.debug("SET failed for %s: %s", self.ip, err)
+            reply = None
+
+        if reply is None:
+            self.async_confirm_switch(None, key)
+            return False
+
+        # Without an echoed relay value the next poll or push confirms the state
+        if str(dpid) in reply:
+            try:
+                self.async_confirm_switch(int(reply[str(dpid)]) > 0, key)
+            except (TypeError, ValueError):
+                pass
+        return True
+
+    @callback
+    def async_set_switch_optimistic(self, state: bool, key: str = "switch") -> None:
+        """Show a relay state immediately, before the device has confirmed it."""
+        previous = self.data
+        data = dict(previous or {})
+        # Pushes merge into the last raw report, which may not exist before the first poll
+        data.setdefault("raw", {})
+        pending = self._pending.get(key)
+        before = pending[1] if pending is not None else data.get(key)
+        data[key] = state
+        self._pending[key] = (state, before, self.hass.loop.time())
+        self._interval.observe(previous, data)
+        self.async_set_updated_data(data)
+
+    @callback
+    def async_confirm_switch(self, actual: Optional[bool], key: str = "switch") -> None:
+        """Settle an optimistic relay state with the device's answer.
+
+        ``actual`` is the relay state echoed by the SET reply, or None if the
+        command failed, in which case the previous state is restored. Without
+        a known previous state there is nothing to restore, and the next poll
+        sets it instead.
+        """
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        expected, before, _ = pending
+        if actual is None:
+            if before is None:
+                self.hass.async_create_task(self.async_request_refresh())
+                return
+            actual = before
+            source = "command_failed"
+        else:
+            source = "set_reply"
+        if actual != expected:
+            self._report_rollback(key, expected, actual, source)
+            self.async_set_updated_data({**(self.data or {}), key: actual})
+
+    def _reconcile_switch(
+        self,
+        result: Dict[str, Any],
+        started: float,
+        source: str,
+        reported: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Check a fresh reading against the pending optimistic relay states.
+
+        ``reported`` holds the raw attributes of a push, which may leave out
+        relays; those stay pending for the SET reply or the next poll.
+        """
+        if not self._pending:
+            return result
+        for key, (expected, _, since) in list(self._pending.items()):
+            if started < since or (reported is not None and str(self.profile.dpid(key)) not in reported):
+                # The read began before the command or did not carry the relay, so its state is stale
+                result = {**result, key: expected}
+                continue
+            del self._pending[key]
+            if result[key] != expected:
+                self._report_rollback(key, expected, result[key], source)
+        return result
+
+    def _report_rollback(self, key: str, expected: bool, actual: Optional[bool], source: str) -> None:
+        _LOGGER.warning(
+            "Switch %s (%s) reported %s after it was set to %s (%s); rolling back",
+            self.ip, key, actual, expected, source,
+        )
+        self.hass.bus.async_fire(
+            EVENT_OPTIMISTIC_ROLLBACK,
+            {
+                "entry_id": self.entry.entry_id,
+                "ip": self.ip,
+                "switch": key,
+                "expected": expected,
+                "actual": actual,
+                "source": source,
+            },
+        )
@@ -1,173 +1,290 @@
 """CozyLife device control class."""
-import socket
-import json
+import asyncio
 import time
 import logging
-from .const import CMD_SET, CMD_QUERY, CMD_INFO
+from .breaker import CircuitBreaker
+from .connection import CozyLifeConnection
+from .metrics import DeviceMetrics
+from .const import (
+    CMD_SET,
+    CMD_QUERY,
+    CMD_INFO,
+    DPID_SWITCH,
+    STATE_DPIDS,
+    DEFAULT_FAILURE_THRESHOLD,
+    BREAKER_MAX_DELAY,
+    BREAKER_JITTER,
+    TRACE_MAX_EVENTS,
+)
+from .protocol import CommandTemplate
+from .trace import TraceRecorder
 
 _LOGGER = logging.getLogger(__name__)
 
+# Hot commands are serialized once; each request only splices in its sn
+QUERY_STATE_COMMAND = CommandTemplate(CMD_QUERY, {'attr': list(STATE_DPIDS)})
+QUERY_INFO_COMMAND = CommandTemplate(CMD_INFO, {})
+# Attribute 0 asks for every attribute the device has
+QUERY_ALL_COMMAND = CommandTemplate(CMD_QUERY, {'attr': [0]})
+
+
+def _set_relay_command(dpid, state):
+    return CommandTemplate(CMD_SET, {'attr': [dpid], 'data': {str(dpid): 255 if state else 0}})
+
+
+SET_RELAY_COMMANDS = {state: _set_relay_command(DPID_SWITCH, state) for state in (True, False)}
+
+
 class CozyLifeDevice:
-    """Class to communicate with CozyLife devices."""
+    """Class to communicate with CozyLife devices over a persistent connection."""
+
+    def __init__(self, ip, port=5555, timeout=3, retry_window=10, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 open_connection=None, pool=None):
+        """Initialize the device.
 
-    def __init__(self, ip, port=5555, timeout=3, retry_window=10):
-        """Initialize the device."""
+        ``retry_window`` is the first backoff delay once ``failure_threshold``
+        requests in a row have failed; it doubles on every failed probe.
+        ``open_connection`` replaces ``asyncio.open_connection``, e.g. with a
+        ``TraceReplayer`` to run the device against a recorded trace. With a
+        ``pool`` the connection is opened and kept under the fleet's socket
+        cap and may be closed by the pool while idle.
+        """
         self.ip = ip
         self.port = port
-        self._socket = None
+        self._connection = None
         # Use shared timeout for connect and read to simplify configuration
         self._connect_timeout = max(float(timeout), 0.1)
         self._read_timeout = max(float(timeout), 0.1)
-        self._last_connect_attempt = 0
-        # Seconds between connection attempts (backoff window)
-        self._connect_retry_delay = max(float(retry_window), 0)
+        self.breaker = CircuitBreaker(failure_threshold, retry_window, BREAKER_MAX_DELAY, BREAKER_JITTER)
+        self.metrics = DeviceMetrics()
+        self._query_command = QUERY_STATE_COMMAND
+        # SET templates of further relays, built on first use
+        self._relay_commands = {}
+        # Concurrent requests share one connection, so only one may open it
+        self._connect_lock = asyncio.Lock()
+        self._last_sn = 0
+        # Called with every message that is not a reply to a pending request
+        self.message_callback = None
+        self._open_connection = open_connection
+        self._pool = pool
+        # Ask the pool not to close the connection while idle, e.g. to receive pushes
+        self.keep_connection = False
+        # TraceRecorder of the running capture, if any
+        self.recorder = None
 
-    def test_connection(self):
+    @property
+    def connected(self):
+        """Return True while the persistent connection is open."""
+        return self._connection is not None and self._connection.connected
+
+    async def test_connection(self):
         """Test if we can connect to the device."""
         try:
-            self._ensure_connection()
             # Try to query device state
-            result = self.query_state()
+            result = await self.query_state()
             return result is not None
         except Exception:
             return False
         finally:
-            self._close_connection()
+            await self.close()
 
-    def _ensure_connection(self):
+    async def _ensure_connection(self):
         """Ensure connection is established."""
-        current_time = time.time()
-        
-        # If connection exists, return True
-        if self._socket is not None:
-            return True
-            
-        # Check if we should retry connection
-        if (current_time - self._last_connect_attempt) < self._connect_retry_delay:
-            return False
+        async with self._connect_lock:
+            pool = self._pool
+            # If connection exists, return True
+            if self.connected:
+                if pool is not None:
+                    pool.touch(self._connection)
+                return True
 
-        self._last_connect_attempt = current_time
-        
-        try:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._socket.settimeout(self._connect_timeout)
-            self._socket.connect((self.ip, self.port))
+            if pool is not None and not await pool.async_reserve(self._connect_timeout):
+                _LOGGER.debug(f"No free connection slot for {self.ip}")
+                return False
+            connection = CozyLifeConnection(
+                self.ip, self.port, on_message=self._handle_message, metrics=self.metrics,
+                recorder=self.recorder, open_connection=self._open_connection,
+                on_close=pool.release if pool is not None else None,
+            )
+            started = time.monotonic()
+            try:
+                await connection.async_connect(self._connect_timeout)
+            except Exception as e:
+                _LOGGER.debug(f"Connection failed to {self.ip}: {e}")
+                self.metrics.record_connect_failure()
+                await connection.async_close()
+                self._connection = None
+                if pool is not None:
+                    pool.cancel_reservation()
+                return False
+            elapsed = time.monotonic() - started
+            self.metrics.record_connect(elapsed)
+            self._connection = connection
+            if pool is not None:
+                pool.add(self, connection, elapsed)
             return True
-        except Exception as e:
-            _LOGGER.debug(f"Connection failed to {self.ip}: {e}")
-            self._close_connection()
-            return False
 
     def is_backing_off(self):
-        """Return True if currently in connection backoff window without a socket."""
-        if self._socket is not None:
-            return False
-        current_time = time.time()
-        return (current_time - self._last_connect_attempt) < self._connect_retry_delay
+        """Return True while the circuit breaker refuses requests."""
+        return self.breaker.is_blocking()
 
-    def _close_connection(self):
-        """Close the connection safely."""
-        if self._socket:
-            try:
-                self._socket.close()
-            except Exception:
-                pass
-            finally:
-                self._socket = None
+    async def close(self):
+        """Close the connection."""
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            await connection.async_close()
+
+    async def change_ip(self, ip):
+        """Point the device at a new address and drop the old connection."""
+        self.ip = ip
+        await self.close()
+        # The new address has never failed, so try it on the next request
+        self.breaker.retry_now()
+
+    async def start_trace(self, max_events=TRACE_MAX_EVENTS):
+        """Record all traffic with the device from a fresh connection on."""
+        self.recorder = TraceRecorder(self.ip, self.port, max_events)
+        # Reconnect so the trace starts with the connect and replays from it
+        await self.close()
+        return self.recorder
+
+    async def stop_trace(self):
+        """Stop recording and return the recorder, or None if none was running."""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None and self._connection is not None:
+            # The open connection keeps recording until closed
+            await self.close()
+        return recorder
+
+    def _handle_message(self, message):
+        """Forward unsolicited messages to the registered callback."""
+        if self.message_callback is not None:
+            self.message_callback(message)
+        else:
+            _LOGGER.debug(f"Ignoring unsolicited message from {self.ip}: {message}")
 
     def _get_sn(self):
-        """Generate sequence number."""
-        return str(int(round(time.time() * 1000)))
+        """Generate a sequence number, unique even for requests in the same millisecond."""
+        sn = max(int(round(time.time() * 1000)), self._last_sn + 1)
+        self._last_sn = sn
+        return str(sn)
 
-    def _read_response(self):
-        """Read response from socket with proper handling of multiple JSON objects."""
-        if not self._socket:
-            return None
+    async def _send_message(self, template):
+        """Send a pre-encoded command and return the reply matching its sn.
 
+        Every outcome is reported to the circuit breaker; while it is open the
+        request is refused without touching the network.
+        """
+        if not self.breaker.allow_request():
+            self.metrics.record_refused()
+            return None
         try:
-            self._socket.settimeout(self._read_timeout)
-            data = ""
-            while True:
-                try:
-                    chunk = self._socket.recv(1024).decode('utf-8')
-                    if not chunk:
-                        break
-                    data += chunk
-                    if '\n' in data:
-                        # Take only the first line as in original code
-                        json_data = data.split('\n')[0].strip()
-                        if not json_data:  # Skip empty lines
-                            data = data.split('\n', 1)[1] if '\n' in data else ""
-                            continue
-                        
-                        try:
-                            return json.loads(json_data)
-                        except json.JSONDecodeError:
-                            # Log the invalid JSON for debugging but don't crash
-                            _LOGGER.debug(
-                                f"Received invalid JSON from {self.ip}, skipping. "
-                                f"Length: {len(json_data)} chars"
-                            )
-                            # Move to next line if this one is invalid
-                            data = data.split('\n', 1)[1] if '\n' in data else ""
-                            continue
-                except UnicodeDecodeError:
-                    _LOGGER.debug(f"Received invalid UTF-8 data from {self.ip}, skipping")
-                    data = ""
-                    continue
-                    
-        except socket.timeout:
-            _LOGGER.debug(f"Read timeout from {self.ip}")
-        except ConnectionResetError:
-            _LOGGER.debug(f"Connection reset by {self.ip}")
-            self._close_connection()
-        except Exception as e:
-            _LOGGER.debug(f"Error reading from {self.ip}: {str(e)}")
-            self._close_connection()
-        
-        return None
+            response = await self._request(template)
+        except BaseException:
+            # Also on cancellation: an abandoned probe must not leave the breaker half-open
+            self.breaker.record_failure()
+            raise
+        if response is None:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
 
-    def _send_message(self, command):
-        """Send message to device."""
-        if not self._ensure_connection():
+    async def _request(self, template):
+        if not await self._ensure_connection():
             return None
 
+        connection = self._connection
+        sn = self._get_sn()
+        started = time.monotonic()
         try:
-            payload = json.dumps(command) + "\r\n"
-            self._socket.send(payload.encode('utf-8'))
-            return self._read_response()
+            response = await connection.async_request_encoded(
+                template.cmd, sn, template.encode(sn), self._read_timeout
+            )
         except Exception as e:
             _LOGGER.debug(f"Failed to communicate with {self.ip}: {e}")
-            self._close_connection()
+            self.metrics.record_error()
+            if self._connection is connection:
+                await self.close()
             return None
+        finally:
+            if self._pool is not None:
+                self._pool.request_done(connection)
+        if response is None:
+            self.metrics.record_timeout()
+        else:
+            self.metrics.record_rtt(time.monotonic() - started)
+        return response
+
+    async def _send_set(self, state, dpid=DPID_SWITCH):
+        """Send a SET for a relay and return the raw reply."""
+        state = bool(state)
+        if dpid == DPID_SWITCH:
+            template = SET_RELAY_COMMANDS[state]
+        else:
+            template = self._relay_commands.get((dpid, state))
+            if template is None:
+                template = self._relay_commands[(dpid, state)] = _set_relay_command(dpid, state)
+        return await self._send_message(template)
 
-    def send_command(self, state):
+    async def send_command(self, state):
         """Send command to device."""
-        command = {
-            'cmd': CMD_SET,
-            'pv': 0,
-            'sn': self._get_sn(),
-            'msg': {
-                'attr': [1],
-                'data': {
-                    '1': 255 if state else 0
-                }
-            }
-        }
-        response = self._send_message(command)
+        response = await self._send_set(state)
         return response is not None and response.get('res') == 0
 
-    def query_state(self):
+    async def set_state(self, state, dpid=DPID_SWITCH):
+        """Switch a relay and return the state data echoed in the reply.
+
+        Returns None if the command failed; the dict may be empty when the
+        firmware acknowledges without echoing data.
+        """
+        response = await self._send_set(state, dpid)
+        if response is None or response.get('res') != 0:
+            return None
+        msg = response.get('msg')
+        data = msg.get('data') if isinstance(msg, dict) else None
+        return data if isinstance(data, dict) else {}
+
+    def set_query_attributes(self, attrs):
+        """Set the attributes a state query asks for."""
+        attrs = list(attrs)
+        if attrs == list(STATE_DPIDS):
+            self._query_command = QUERY_STATE_COMMAND
+        else:
+            self._query_command = CommandTemplate(CMD_QUERY, {'attr': attrs})
+
+    async def probe_capabilities(self):
+        """Return the sorted attribute ids the device has, or None if it did not answer.
+
+        Combines the dpid list of CMD_INFO, where the firmware reports one, with
+        the attributes a query for everything returns.
+        """
+        found = set()
+        info = await self.query_info()
+        if info and isinstance(info.get('dpid'), list):
+            found.update(dpid for dpid in info['dpid'] if isinstance(dpid, int))
+        response = await self._send_message(QUERY_ALL_COMMAND)
+        msg = response.get('msg') if response else None
+        data = msg.get('data') if isinstance(msg, dict) else None
+        if not data:
+            # Firmware that ignores attribute 0: see which of the known ones it answers
+            data = await self.query_state()
+        if isinstance(data, dict):
+            found.update(int(key) for key in data if str(key).isdigit())
+        if info is None and not data:
+            return None
+        return sorted(found)
+
+    async def query_state(self):
         """Query device state."""
-        command = {
-            'cmd': CMD_QUERY,
-            'pv': 0,
-            'sn': self._get_sn(),
-            'msg': {
-                'attr': [1, 27, 28, 29]
-            }
-        }
-        response = self._send_message(command)
+        response = await self._send_message(self._query_command)
         if response and response.get('msg'):
             return response['msg'].get('data', {})
         return None
+
+    async def query_info(self):
+        """Query device identity (did, pid, model name)."""
+        response = await self._send_message(QUERY_INFO_COMMAND)
+        if response and isinstance(response.get('msg'), dict):
+            return response['msg']
+        return None
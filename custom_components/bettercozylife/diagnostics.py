@@ -0,0 +1,45 @@
+"""Diagnostics support for BetterCozyLife."""
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_IP_ADDRESS
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, DATA_POOL, DATA_BOOT, CONF_DEVICE_ID
+from .coordinator import CozyLifeCoordinator
+
+TO_REDACT = {CONF_IP_ADDRESS, CONF_DEVICE_ID, "unique_id"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    """Return connection health, circuit breaker state and the last reading of a plug."""
+    coordinator: CozyLifeCoordinator = hass.data[DOMAIN][entry.entry_id]
+    device = coordinator.device
+    breaker = device.breaker
+    data = dict(coordinator.data or {})
+    pool = hass.data[DOMAIN].get(DATA_POOL)
+    boot = hass.data[DOMAIN].get(DATA_BOOT)
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "connection": {
+            "connected": device.connected,
+            "push_mode": coordinator.push_mode,
+            "poll_interval": coordinator.poll_interval,
+            "last_update_success": coordinator.last_update_success,
+        },
+        "circuit_breaker": {
+            "state": breaker.state,
+            "failures": breaker.failures,
+            "failure_threshold": breaker.failure_threshold,
+            "trips": breaker.trips,
+            "retry_in": breaker.retry_in,
+            "backoff_seconds": breaker.backoff_seconds,
+        },
+        "metrics": device.metrics.as_dict(),
+        "connection_pool": pool.as_dict() if pool is not None else None,
+        "startup": boot.as_dict() if boot is not None else None,
+        "data": data,
+    }
@@ -0,0 +1,150 @@
+"""LAN discovery of CozyLife devices."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from ipaddress import IPv4Network, ip_interface
+from typing import Any, Dict, Iterable, List, Optional
+
+from homeassistant.components import network
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    DOMAIN,
+    DATA_DISCOVERY,
+    DISCOVERY_CACHE_TTL,
+    DISCOVERY_CONNECT_TIMEOUT,
+    DISCOVERY_MAX_CONCURRENT,
+    DISCOVERY_MIN_PREFIX,
+)
+from .cozylife_device import CozyLifeDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_probe_host(
+    ip: str,
+    port: int = 5555,
+    timeout: float = DISCOVERY_CONNECT_TIMEOUT,
+) -> Optional[Dict[str, Any]]:
+    """Return the CMD_INFO reply of a CozyLife device at ``ip``, or None."""
+    device = CozyLifeDevice(ip, port=port, timeout=timeout, retry_window=0)
+    try:
+        info = await device.query_info()
+    except Exception as err:
+        _LOGGER.debug("Probe of %s failed: %s", ip, err)
+        info = None
+    finally:
+        await device.close()
+    if not info:
+        return None
+    return {**info, "ip": ip}
+
+
+async def async_scan_hosts(
+    hosts: Iterable[str],
+    port: int = 5555,
+    timeout: float = DISCOVERY_CONNECT_TIMEOUT,
+    max_concurrent: int = DISCOVERY_MAX_CONCURRENT,
+) -> List[Dict[str, Any]]:
+    """Probe hosts concurrently and return the devices that answered CMD_INFO."""
+    semaphore = asyncio.Semaphore(max(int(max_concurrent), 1))
+
+    async def _probe(ip: str) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            return await async_probe_host(ip, port, timeout)
+
+    results = await asyncio.gather(*(_probe(ip) for ip in hosts))
+    return [info for info in results if info]
+
+
+async def async_get_scan_hosts(hass: HomeAssistant) -> List[str]:
+    """Return the host addresses of every enabled IPv4 network Home Assistant is on."""
+    hosts: Dict[str, None] = {}
+    for adapter in await network.async_get_adapters(hass):
+        if not adapter["enabled"]:
+            continue
+        for ip_info in adapter["ipv4"]:
+            interface = ip_interface(f"{ip_info['address']}/{ip_info['network_prefix']}")
+            if interface.is_loopback or interface.is_link_local:
+                continue
+            net = interface.network
+            if net.prefixlen < DISCOVERY_MIN_PREFIX:
+                net = IPv4Network(f"{ip_info['address']}/{DISCOVERY_MIN_PREFIX}", strict=False)
+            own = str(interface.ip)
+            for host in net.hosts():
+                host_ip = str(host)
+                if host_ip != own:
+                    hosts[host_ip] = None
+    return list(hosts)
+
+
+async def async_discover_devices(
+    hass: HomeAssistant,
+    max_age: float = DISCOVERY_CACHE_TTL,
+    exclude: Iterable[str] = (),
+) -> List[Dict[str, Any]]:
+    """Scan the local networks for CozyLife devices, reusing a recent result.
+
+    Results are cached in ``hass.data[DOMAIN]`` and reused while younger than
+    ``max_age`` seconds; concurrent callers share one scan in progress. Hosts
+    in ``exclude`` are not probed, and such a partial scan is only reused by
+    callers that exclude hosts themselves.
+    """
+    skip = frozenset(exclude)
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    cache = domain_data.get(DATA_DISCOVERY)
+    if cache is not None and (cache["complete"] or skip):
+        task = cache.get("task")
+        if task is not None:
+            return list(await asyncio.shield(task))
+        if time.monotonic() - cache["timestamp"] < max_age:
+            return list(cache["devices"])
+
+    async def _scan() -> List[Dict[str, Any]]:
+        hosts = [host for host in await async_get_scan_hosts(hass) if host not in skip]
+        started = time.monotonic()
+        devices = await async_scan_hosts(hosts)
+        _LOGGER.debug(
+            "Scanned %d hosts in %.1fs, found %d CozyLife devices",
+            len(hosts), time.monotonic() - started, len(devices),
+        )
+        return devices
+
+    task = hass.async_create_task(_scan())
+    domain_data[DATA_DISCOVERY] = {"task": task, "timestamp": 0.0, "devices": [], "complete": not skip}
+
+    def _store(done: asyncio.Task) -> None:
+        current = domain_data.get(DATA_DISCOVERY)
+        if current is None or current["task"] is not done:
+            # A full scan started meanwhile and owns the cache
+            return
+        if done.cancelled() or done.exception() is not None:
+            domain_data.pop(DATA_DISCOVERY, None)
+            return
+        domain_data[DATA_DISCOVERY] = {
+            "task": None,
+            "timestamp": time.monotonic(),
+            "devices": done.result(),
+            "complete": not skip,
+        }
+
+    task.add_done_callback(_store)
+    return list(await asyncio.shield(task))
+
+
+async def async_find_device(
+    hass: HomeAssistant,
+    device_id: str,
+    max_age: float,
+    exclude: Iterable[str] = (),
+) -> Optional[str]:
+    """Return the current IP of the device with ``device_id``, or None if not found.
+
+    ``exclude`` lists addresses known to belong to other devices, which are not probed.
+    """
+    for info in await async_discover_devices(hass, max_age=max_age, exclude=exclude):
+        if info.get("did") == device_id:
+            return info["ip"]
+    return None
@@ -0,0 +1,47 @@
+"""Energy accumulation from instantaneous power samples."""
+from __future__ import annotations
+
+from typing import Optional
+
+
+class EnergyAccumulator:
+    """Integrate power readings into a kWh total with the trapezoidal rule.
+
+    Timestamps must come from a monotonic clock so wall clock changes cannot
+    add or remove energy. A span longer than ``max_gap`` seconds (a plug that
+    stopped answering, a restart) is not integrated: the load during it is
+    unknown, so the total stays put and integration resumes from the next
+    sample rather than guessing.
+    """
+
+    def __init__(self, max_gap: float) -> None:
+        self.max_gap = float(max_gap)
+        self.total_kwh = 0.0
+        self._last_power: Optional[float] = None
+        self._last_time: Optional[float] = None
+        self._restored = False
+
+    def add_sample(self, power: float, now: float) -> float:
+        """Account for the time since the previous sample and return the total."""
+        power = max(float(power), 0.0)
+        if self._last_time is not None:
+            elapsed = now - self._last_time
+            if elapsed <= 0:
+                # Same instant (e.g. a push and a poll together): keep the first baseline
+                return self.total_kwh
+            if elapsed <= self.max_gap:
+                self.total_kwh += (self._last_power + power) / 2 * elapsed / 3_600_000
+        self._last_power = power
+        self._last_time = now
+        return self.total_kwh
+
+    def restore(self, total_kwh: float) -> None:
+        """Add a total persisted before a restart to what accumulated since.
+
+        Only the first call counts: an entity re-added after an entity id change
+        would otherwise restore the running total on top of itself.
+        """
+        if self._restored:
+            return
+        self._restored = True
+        self.total_kwh += max(float(total_kwh), 0.0)
@@ -0,0 +1,170 @@
+"""Latency and health counters for CozyLife devices, and startup timings."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Set
+
+# Upper bounds of the round-trip histogram buckets in seconds; the last bucket is +Inf
+RTT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Weight of the newest sample in the smoothed round-trip time
+RTT_SMOOTHING = 0.2
+
+
+class DeviceMetrics:
+    """Counters and a round-trip histogram for one plug.
+
+    The device, its connections and the coordinator all record into the same
+    instance; it survives reconnects, so counters only ever grow.
+    """
+
+    def __init__(self) -> None:
+        self.connects = 0
+        self.connect_failures = 0
+        self.last_connect_time: Optional[float] = None
+        self.requests = 0
+        self.timeouts = 0
+        # Requests that failed because the connection broke while they were out
+        self.errors = 0
+        # Connections the plug closed or reset
+        self.resets = 0
+        self.invalid_messages = 0
+        self.refused = 0
+        self.polls = 0
+        self.poll_failures = 0
+        self.rtt_smoothed: Optional[float] = None
+        self.rtt_sum = 0.0
+        self.rtt_buckets: List[int] = [0] * (len(RTT_BUCKETS) + 1)
+
+    @property
+    def reconnects(self) -> int:
+        """Connections opened after the first one."""
+        return max(self.connects - 1, 0)
+
+    def record_connect(self, seconds: float) -> None:
+        self.connects += 1
+        self.last_connect_time = seconds
+
+    def record_connect_failure(self) -> None:
+        self.connect_failures += 1
+
+    def record_rtt(self, seconds: float) -> None:
+        """Record the round trip of a request that got its reply."""
+        self.requests += 1
+        self.rtt_sum += seconds
+        self.rtt_buckets[bisect_left(RTT_BUCKETS, seconds)] += 1
+        if self.rtt_smoothed is None:
+            self.rtt_smoothed = seconds
+        else:
+            self.rtt_smoothed += RTT_SMOOTHING * (seconds - self.rtt_smoothed)
+
+    def record_timeout(self) -> None:
+        self.requests += 1
+        self.timeouts += 1
+
+    def record_error(self) -> None:
+        self.requests += 1
+        self.errors += 1
+
+    def record_reset(self) -> None:
+        self.resets += 1
+
+    def record_invalid_message(self, count: int = 1) -> None:
+        """Count received lines that were dropped as undecodable or oversized."""
+        self.invalid_messages += count
+
+    def record_refused(self) -> None:
+        """Count a request the circuit breaker refused to send."""
+        self.refused += 1
+
+    def record_poll(self, success: bool) -> None:
+        self.polls += 1
+        if not success:
+            self.poll_failures += 1
+
+    def cumulative_buckets(self) -> List[int]:
+        """Histogram counts per bucket bound, cumulative as Prometheus expects."""
+        counts = []
+        total = 0
+        for count in self.rtt_buckets:
+            total += count
+            counts.append(total)
+        return counts
+
+    def as_dict(self) -> Dict[str, Any]:
+        answered = self.requests - self.timeouts - self.errors
+        return {
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "connect_failures": self.connect_failures,
+            "last_connect_time": self.last_connect_time,
+            "requests": self.requests,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "resets": self.resets,
+            "invalid_messages": self.invalid_messages,
+            "refused": self.refused,
+            "polls": self.polls,
+            "poll_failures": self.poll_failures,
+            "rtt_smoothed": self.rtt_smoothed,
+            "rtt_mean": self.rtt_sum / answered if answered else None,
+            "rtt_histogram": {
+                **{str(bound): count for bound, count in zip(RTT_BUCKETS, self.rtt_buckets)},
+                "+Inf": self.rtt_buckets[-1],
+            },
+        }
+
+
+class BootMetrics:
+    """How long the integration took to come up, measured in loop time from ``started``.
+
+    Entries set up in fast-start mode return before their first poll; they
+    stay pending until it finishes, and ``ready_seconds`` is when the last
+    pending one did.
+    """
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.entries = 0
+        self.fast_started = 0
+        # Time spent inside async_setup_entry, over all entries and the slowest one
+        self.setup_seconds = 0.0
+        self.max_setup_seconds = 0.0
+        self.first_refresh_ok = 0
+        self.first_refresh_failed = 0
+        self.pending: Set[str] = set()
+        self.ready_seconds: Optional[float] = None
+
+    def record_setup(self, entry_id: str, seconds: float, fast_start: bool) -> None:
+        self.entries += 1
+        self.setup_seconds += seconds
+        self.max_setup_seconds = max(self.max_setup_seconds, seconds)
+        if fast_start:
+            self.fast_started += 1
+            self.pending.add(entry_id)
+
+    def record_first_refresh(self, entry_id: str, success: bool, now: float) -> None:
+        if entry_id not in self.pending:
+            return
+        self.pending.discard(entry_id)
+        if success:
+            self.first_refresh_ok += 1
+        else:
+            self.first_refresh_failed += 1
+        if not self.pending:
+            self.ready_seconds = now - self.started
+
+    def forget(self, entry_id: str) -> None:
+        """Stop waiting for an entry unloaded before its first poll."""
+        self.pending.discard(entry_id)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "entries": self.entries,
+            "fast_started": self.fast_started,
+            "setup_seconds": self.setup_seconds,
+            "max_setup_seconds": self.max_setup_seconds,
+            "first_refresh_ok": self.first_refresh_ok,
+            "first_refresh_failed": self.first_refresh_failed,
+            "pending_first_refresh": len(self.pending),
+            "ready_seconds": self.ready_seconds,
+        }
@@ -0,0 +1,238 @@
+"""Fleet-wide pool that leases plug connections under one cap on open sockets."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional
+
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    DEFAULT_POOL_MAX_OPEN,
+    DEFAULT_POOL_IDLE_TIMEOUT,
+    POOL_KEEPALIVE_IDLE,
+)
+
+if TYPE_CHECKING:
+    from .connection import CozyLifeConnection
+    from .cozylife_device import CozyLifeDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class _Lease:
+    device: CozyLifeDevice
+    # Loop time of the last request on the connection
+    last_used: float
+
+
+class PoolStats:
+    """Counters of the pool; like ``DeviceMetrics`` they only ever grow."""
+
+    def __init__(self) -> None:
+        # Requests that found their plug's connection open, or had to open one
+        self.hits = 0
+        self.misses = 0
+        self.connect_seconds = 0.0
+        self.idle_evictions = 0
+        self.lru_evictions = 0
+        # Connects that had to wait for a free slot, and those that gave up
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.wait_timeouts = 0
+        self.peak_open = 0
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        leases = self.hits + self.misses
+        return self.hits / leases if leases else None
+
+    @property
+    def mean_connect_time(self) -> Optional[float]:
+        """Average cost of opening a connection, in seconds."""
+        return self.connect_seconds / self.misses if self.misses else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "mean_connect_time": self.mean_connect_time,
+            "idle_evictions": self.idle_evictions,
+            "lru_evictions": self.lru_evictions,
+            "waits": self.waits,
+            "wait_seconds": self.wait_seconds,
+            "wait_timeouts": self.wait_timeouts,
+            "peak_open": self.peak_open,
+        }
+
+
+class CozyLifeConnectionPool:
+    """Leases connections to every plug's ``CozyLifeDevice`` under one socket cap.
+
+    A device asks for a slot before it connects and hands the connection to
+    the pool once open; each later request on it counts as a hit and moves it
+    to the back of the LRU order. Connections idle longer than
+    ``idle_timeout`` are closed by a sweeper, which frees the plug's few
+    socket slots for the CozyLife app, and at the cap the least recently used
+    idle connection makes room for a new one. Devices that keep their
+    connection for pushed updates are not swept and only evicted at the cap
+    when nothing else is idle. Dead peers are found by TCP keepalive instead
+    of extra requests to the plugs.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        max_open: int = DEFAULT_POOL_MAX_OPEN,
+        idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT,
+        keepalive_idle: int = POOL_KEEPALIVE_IDLE,
+    ) -> None:
+        self.hass = hass
+        self.max_open = max(int(max_open), 1)
+        self.idle_timeout = max(float(idle_timeout), 1.0)
+        self.keepalive_idle = keepalive_idle
+        self.stats = PoolStats()
+        # Open connections, least recently used first
+        self._leases: OrderedDict[CozyLifeConnection, _Lease] = OrderedDict()
+        # Connections open or being opened
+        self._slots = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def open_connections(self) -> int:
+        return len(self._leases)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "open": self.open_connections,
+            "max_open": self.max_open,
+            "idle_timeout": self.idle_timeout,
+            **self.stats.as_dict(),
+        }
+
+    def touch(self, connection: CozyLifeConnection) -> None:
+        """Record a request on an open pooled connection."""
+        lease = self._leases.get(connection)
+        if lease is not None:
+            lease.last_used = self.hass.loop.time()
+            self._leases.move_to_end(connection)
+        self.stats.hits += 1
+
+    async def async_reserve(self, timeout: float) -> bool:
+        """Take a slot for a new connection; False if none came free in time."""
+        loop = self.hass.loop
+        started = loop.time()
+        waited = False
+        while self._slots >= self.max_open:
+            if self._evict_lru():
+                continue
+            remaining = started + timeout - loop.time()
+            if remaining <= 0:
+                self.stats.wait_timeouts += 1
+                return False
+            waited = True
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        if waited:
+            self.stats.waits += 1
+            self.stats.wait_seconds += loop.time() - started
+        self._slots += 1
+        return True
+
+    def cancel_reservation(self) -> None:
+        """Give back a slot whose connect failed."""
+        self._free_slot()
+
+    def add(self, device: CozyLifeDevice, connection: CozyLifeConnection, connect_seconds: float) -> None:
+        """Hand a newly opened connection to the pool."""
+        self._leases[connection] = _Lease(device, self.hass.loop.time())
+        self.stats.misses += 1
+        self.stats.connect_seconds += connect_seconds
+        self.stats.peak_open = max(self.stats.peak_open, len(self._leases))
+        connection.set_keepalive(self.keepalive_idle)
+        if self._task is None:
+            self._task = self.hass.async_create_background_task(
+                self._async_sweep(), "bettercozylife connection pool"
+            )
+
+    def request_done(self, connection: CozyLifeConnection) -> None:
+        """Record that a request finished; a connect waiting at the cap may now evict it."""
+        lease = self._leases.get(connection)
+        if lease is not None:
+            lease.last_used = self.hass.loop.time()
+        if self._waiters and not connection.busy:
+            self._wake()
+
+    def release(self, connection: CozyLifeConnection) -> None:
+        """Forget a closed connection; called by the connection as it closes."""
+        if self._leases.pop(connection, None) is not None:
+            self._free_slot()
+
+    async def async_stop(self) -> None:
+        """Stop the sweeper; connections are closed by their devices."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _free_slot(self) -> None:
+        self._slots = max(self._slots - 1, 0)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _evict_lru(self) -> bool:
+        """Close the least recently used idle connection; False if all are busy."""
+        victim = None
+        for connection, lease in self._leases.items():
+            if connection.busy:
+                continue
+            if not lease.device.keep_connection:
+                victim = connection
+                break
+            if victim is None:
+                victim = connection
+        if victim is None:
+            return False
+        _LOGGER.debug("Connection pool full, closing least recently used connection to %s", victim.ip)
+        self.stats.lru_evictions += 1
+        # Closing releases the slot
+        victim.close()
+        return True
+
+    async def _async_sweep(self) -> None:
+        interval = max(self.idle_timeout / 2, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = self.hass.loop.time() - self.idle_timeout
+            idle = []
+            for connection, lease in self._leases.items():
+                if lease.last_used > cutoff:
+                    # Later connections were used even more recently
+                    break
+                if not connection.busy and not lease.device.keep_connection:
+                    idle.append(connection)
+            for connection in idle:
+                _LOGGER.debug("Closing connection to %s after %.0fs idle", connection.ip, self.idle_timeout)
+                self.stats.idle_evictions += 1
+                connection.close()
@@ -0,0 +1,165 @@
+"""Device profiles: how each CozyLife product type maps attributes to entities.
+
+A profile lists the attributes ("dpid") a product reports, how to turn the raw
+values into entity values, and which switch and sensor entities to create. The
+coordinator decodes every reply through the profile's precompiled table and the
+platforms generate their entities from it, so a new product type only needs a
+new ``DeviceProfile`` in ``PROFILES``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass
+from homeassistant.const import UnitOfElectricCurrent, UnitOfElectricPotential, UnitOfPower
+
+from .const import (
+    DEVICE_TYPE_SWITCH,
+    SWITCH_TYPE_CODE,
+    DPID_SWITCH,
+    DPID_CURRENT,
+    DPID_POWER,
+    DPID_VOLTAGE,
+    CONF_POWER_DEADBAND,
+    CONF_CURRENT_DEADBAND,
+    CONF_VOLTAGE_DEADBAND,
+)
+
+
+@dataclass(frozen=True)
+class AttributeSpec:
+    """One device attribute and the data key its decoded value is stored under.
+
+    Relay attributes decode to a bool (any value above 0 is on, a missing one
+    off); all others to ``raw / divisor``, or None if the device did not send it.
+    """
+
+    dpid: int
+    key: str
+    divisor: float = 1.0
+    relay: bool = False
+
+
+@dataclass(frozen=True)
+class SwitchSpec:
+    """A relay exposed as a switch entity; ``name`` None means the plug's own name."""
+
+    key: str
+    name: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class SensorSpec:
+    """A measurement sensor for the attribute stored under ``key``."""
+
+    key: str
+    name: str
+    device_class: Optional[SensorDeviceClass]
+    unit: Optional[str]
+    state_class: Optional[SensorStateClass] = SensorStateClass.MEASUREMENT
+    # Option holding the sensor's state write deadband, if it has one
+    deadband_option: Optional[str] = None
+    # Keep a history of the readings for min, max, mean and p95 sensors
+    statistics: bool = False
+
+
+@dataclass(frozen=True)
+class DeviceProfile:
+    """Attribute schema and entities of one CozyLife product type."""
+
+    type_code: str
+    device_type: str
+    model: str
+    attributes: Tuple[AttributeSpec, ...]
+    switches: Tuple[SwitchSpec, ...] = ()
+    sensors: Tuple[SensorSpec, ...] = ()
+    # Data key of the power reading integrated into an energy sensor, if any
+    energy_key: Optional[str] = None
+    _decoders: Tuple[Tuple[str, str, float, bool], ...] = field(init=False, repr=False, compare=False)
+    _dpids: Dict[str, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # Replies key attributes by their id as a string; resolve that once here
+        object.__setattr__(self, "_decoders", tuple(
+            (str(spec.dpid), spec.key, float(spec.divisor), spec.relay) for spec in self.attributes
+        ))
+        object.__setattr__(self, "_dpids", {spec.key: spec.dpid for spec in self.attributes})
+
+    @property
+    def state_dpids(self) -> Tuple[int, ...]:
+        """Attributes to query for the state, in schema order."""
+        return tuple(spec.dpid for spec in self.attributes)
+
+    @property
+    def relay_dpids(self) -> Tuple[int, ...]:
+        return tuple(spec.dpid for spec in self.attributes if spec.relay)
+
+    @property
+    def switch_keys(self) -> Tuple[str, ...]:
+        return tuple(spec.key for spec in self.switches)
+
+    @property
+    def sampled_keys(self) -> Tuple[str, ...]:
+        """Sensor keys whose readings feed the rolling statistics."""
+        return tuple(spec.key for spec in self.sensors if spec.statistics)
+
+    @property
+    def power_key(self) -> Optional[str]:
+        """Key of the power sensor, whose changes count as load activity; None if there is none."""
+        for spec in self.sensors:
+            if spec.device_class == SensorDeviceClass.POWER:
+                return spec.key
+        return None
+
+    def dpid(self, key: str) -> int:
+        """Return the attribute the value under ``key`` is read from."""
+        return self._dpids[key]
+
+    def decode(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Map raw device attributes to entity values."""
+        result: Dict[str, Any] = {}
+        for dpid, key, divisor, relay in self._decoders:
+            value = state.get(dpid)
+            if relay:
+                result[key] = value is not None and value > 0
+            else:
+                result[key] = None if value is None else float(value) / divisor
+        result["raw"] = state
+        return result
+
+
+METERED_PLUG = DeviceProfile(
+    type_code=SWITCH_TYPE_CODE,
+    device_type=DEVICE_TYPE_SWITCH,
+    model="Smart Switch",
+    attributes=(
+        AttributeSpec(DPID_SWITCH, "switch", relay=True),
+        AttributeSpec(DPID_CURRENT, "current", divisor=1000.0),
+        AttributeSpec(DPID_POWER, "power"),
+        AttributeSpec(DPID_VOLTAGE, "voltage"),
+    ),
+    switches=(SwitchSpec("switch"),),
+    sensors=(
+        SensorSpec("power", "Power", SensorDeviceClass.POWER, UnitOfPower.WATT,
+                   deadband_option=CONF_POWER_DEADBAND, statistics=True),
+        SensorSpec("current", "Current", SensorDeviceClass.CURRENT, UnitOfElectricCurrent.AMPERE,
+                   deadband_option=CONF_CURRENT_DEADBAND, statistics=True),
+        SensorSpec("voltage", "Voltage", SensorDeviceClass.VOLTAGE, UnitOfElectricPotential.VOLT,
+                   deadband_option=CONF_VOLTAGE_DEADBAND, statistics=True),
+    ),
+    energy_key="power",
+)
+
+# Profiles by CozyLife type code
+PROFILES: Dict[str, DeviceProfile] = {
+    profile.type_code: profile for profile in (METERED_PLUG,)
+}
+
+
+def get_profile(device_type: str) -> DeviceProfile:
+    """Return the profile for an entry's device type, or a type code."""
+    for profile in PROFILES.values():
+        if device_type in (profile.device_type, profile.type_code):
+            return profile
+    raise KeyError(f"Unsupported CozyLife device type: {device_type}")
@@ -0,0 +1,178 @@
+"""Prometheus text endpoint with the health metrics of every plug."""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+from aiohttp import web
+from homeassistant.components.http import KEY_HASS, HomeAssistantView
+
+from .const import DOMAIN, DATA_POOL, DATA_BOOT
+from .coordinator import CozyLifeCoordinator
+from .metrics import RTT_BUCKETS, BootMetrics
+from .pool import CozyLifeConnectionPool
+
+METRICS_URL = "/api/bettercozylife/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (name, type, help, value) per metric; every sample is labelled with the plug
+_SIMPLE_METRICS = (
+    ("up", "gauge", "1 while the plug is available",
+     lambda c: 1 if c.coordinator_available else 0),
+    ("connected", "gauge", "1 while a connection to the plug is open",
+     lambda c: 1 if c.device.connected else 0),
+    ("breaker_open", "gauge", "1 while the circuit breaker refuses requests",
+     lambda c: 1 if c.device.is_backing_off() else 0),
+    ("consecutive_failures", "gauge", "Failed requests in a row",
+     lambda c: c.device.breaker.failures),
+    ("poll_interval_seconds", "gauge", "Current poll interval",
+     lambda c: c.poll_interval),
+    ("connect_duration_seconds", "gauge", "Duration of the last successful connect",
+     lambda c: c.device.metrics.last_connect_time),
+    ("connects_total", "counter", "Connections opened",
+     lambda c: c.device.metrics.connects),
+    ("connect_failures_total", "counter", "Failed connection attempts",
+     lambda c: c.device.metrics.connect_failures),
+    ("reconnects_total", "counter", "Connections opened after the first",
+     lambda c: c.device.metrics.reconnects),
+    ("timeouts_total", "counter", "Requests without a reply in time",
+     lambda c: c.device.metrics.timeouts),
+    ("request_errors_total", "counter", "Requests lost to a broken connection",
+     lambda c: c.device.metrics.errors),
+    ("resets_total", "counter", "Connections closed or reset by the plug",
+     lambda c: c.device.metrics.resets),
+    ("invalid_messages_total", "counter", "Received lines dropped as invalid",
+     lambda c: c.device.metrics.invalid_messages),
+    ("refused_total", "counter", "Requests refused by the circuit breaker",
+     lambda c: c.device.metrics.refused),
+    ("backoff_seconds_total", "counter", "Time spent backing off",
+     lambda c: c.device.breaker.backoff_seconds),
+    ("polls_total", "counter", "Polls run",
+     lambda c: c.device.metrics.polls),
+    ("poll_failures_total", "counter", "Polls that failed",
+     lambda c: c.device.metrics.poll_failures),
+)
+
+# Fleet-wide metrics of the connection pool, without labels
+_POOL_METRICS = (
+    ("pool_open_connections", "gauge", "Connections open in the pool",
+     lambda p: p.open_connections),
+    ("pool_max_open_connections", "gauge", "Cap on connections open at once",
+     lambda p: p.max_open),
+    ("pool_hits_total", "counter", "Requests that found their plug's connection open",
+     lambda p: p.stats.hits),
+    ("pool_misses_total", "counter", "Requests that had to open a connection",
+     lambda p: p.stats.misses),
+    ("pool_connect_seconds_total", "counter", "Time spent opening connections",
+     lambda p: p.stats.connect_seconds),
+    ("pool_idle_evictions_total", "counter", "Connections closed after being idle",
+     lambda p: p.stats.idle_evictions),
+    ("pool_lru_evictions_total", "counter", "Connections closed to make room under the cap",
+     lambda p: p.stats.lru_evictions),
+    ("pool_waits_total", "counter", "Connects that waited for a free slot",
+     lambda p: p.stats.waits),
+    ("pool_wait_seconds_total", "counter", "Time spent waiting for a free slot",
+     lambda p: p.stats.wait_seconds),
+    ("pool_wait_timeouts_total", "counter", "Connects that found no free slot in time",
+     lambda p: p.stats.wait_timeouts),
+)
+
+# Startup timings, without labels
+_BOOT_METRICS = (
+    ("boot_entries", "gauge", "Entries set up since Home Assistant started",
+     lambda b: b.entries),
+    ("boot_fast_started_entries", "gauge", "Entries set up without waiting for their first poll",
+     lambda b: b.fast_started),
+    ("boot_setup_seconds", "gauge", "Time spent setting up entries, summed",
+     lambda b: b.setup_seconds),
+    ("boot_max_setup_seconds", "gauge", "Setup time of the slowest entry",
+     lambda b: b.max_setup_seconds),
+    ("boot_pending_first_refresh", "gauge", "Fast-started entries still waiting for their first poll",
+     lambda b: len(b.pending)),
+    ("boot_first_refresh_failures", "gauge", "Fast-started entries whose first poll failed",
+     lambda b: b.first_refresh_failed),
+    ("boot_ready_seconds", "gauge", "Time from startup until every fast-started entry had polled",
+     lambda b: b.ready_seconds),
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(coordinator: CozyLifeCoordinator, extra: str = "") -> str:
+    labels = (
+        f'device="{_escape(coordinator.identity)}",'
+        f'ip="{_escape(coordinator.ip)}",'
+        f'name="{_escape(coordinator.entry.title)}"'
+    )
+    return "{" + labels + (f",{extra}" if extra else "") + "}"
+
+
+def render_metrics(
+    coordinators: Iterable[CozyLifeCoordinator],
+    pool: Optional[CozyLifeConnectionPool] = None,
+    boot: Optional[BootMetrics] = None,
+) -> str:
+    """Render the metrics of all plugs, the pool and startup in the Prometheus text exposition format."""
+    coordinators = list(coordinators)
+    lines: List[str] = []
+    for name, kind, help_text, value_fn in _SIMPLE_METRICS:
+        metric = f"{DOMAIN}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for coordinator in coordinators:
+            value = value_fn(coordinator)
+            if value is not None:
+                lines.append(f"{metric}{_labels(coordinator)} {value}")
+
+    metric = f"{DOMAIN}_request_duration_seconds"
+    lines.append(f"# HELP {metric} Round trip of answered requests")
+    lines.append(f"# TYPE {metric} histogram")
+    for coordinator in coordinators:
+        metrics = coordinator.device.metrics
+        counts = metrics.cumulative_buckets()
+        bounds = [str(bound) for bound in RTT_BUCKETS] + ["+Inf"]
+        for bound, count in zip(bounds, counts):
+            le = f'le="{bound}"'
+            lines.append(f"{metric}_bucket{_labels(coordinator, le)} {count}")
+        lines.append(f"{metric}_sum{_labels(coordinator)} {metrics.rtt_sum}")
+        lines.append(f"{metric}_count{_labels(coordinator)} {counts[-1]}")
+
+    if pool is not None:
+        for name, kind, help_text, value_fn in _POOL_METRICS:
+            metric = f"{DOMAIN}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value_fn(pool)}")
+
+    if boot is not None:
+        for name, kind, help_text, value_fn in _BOOT_METRICS:
+            value = value_fn(boot)
+            if value is None:
+                continue
+            metric = f"{DOMAIN}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class CozyLifeMetricsView(HomeAssistantView):
+    """Serve fleet-wide plug health for Prometheus; needs a long-lived access token."""
+
+    url = METRICS_URL
+    name = "api:bettercozylife:metrics"
+    requires_auth = True
+
+    async def get(self, request: web.Request) -> web.Response:
+        hass = request.app[KEY_HASS]
+        domain_data: Dict[str, object] = hass.data.get(DOMAIN, {})
+        coordinators = [
+            value for value in domain_data.values() if isinstance(value, CozyLifeCoordinator)
+        ]
+        return web.Response(
+            body=render_metrics(
+                coordinators, domain_data.get(DATA_POOL), domain_data.get(DATA_BOOT)
+            ).encode("utf-8"),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
@@ -0,0 +1,111 @@
+"""Wire-format helpers for the CozyLife JSON-line protocol.
+
+This module has no Home Assistant or package imports so devscripts can load
+it directly from its file path.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, List
+
+try:
+    import orjson
+except ImportError:  # Home Assistant ships orjson; standalone scripts may not have it
+    orjson = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# A device line is a few hundred bytes; anything far larger without a newline is garbage
+DEFAULT_MAX_LINE = 64 * 1024
+
+
+class LineFramer:
+    """Incrementally split a byte stream into complete, decoded lines.
+
+    Bytes are kept in a ``bytearray`` between calls, newlines are located with
+    ``find`` starting where the previous scan stopped, and only complete lines
+    are decoded. A UTF-8 sequence split across two reads therefore decodes
+    correctly, and an undecodable line is dropped on its own instead of taking
+    the rest of the buffer with it.
+    """
+
+    def __init__(self, max_line: int = DEFAULT_MAX_LINE) -> None:
+        self._buffer = bytearray()
+        self._scan_from = 0
+        self._max_line = max_line
+        self.invalid_lines = 0
+        self.overflows = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes that do not form a complete line yet."""
+        return len(self._buffer)
+
+    def reset(self) -> None:
+        """Discard any partial line, e.g. after a reconnect."""
+        self._buffer.clear()
+        self._scan_from = 0
+
+    def feed(self, data: bytes) -> List[str]:
+        """Append received bytes and return every complete, non-empty line."""
+        buffer = self._buffer
+        buffer += data
+        lines: List[str] = []
+        start = 0
+        index = buffer.find(b"\n", self._scan_from)
+        if index != -1:
+            with memoryview(buffer) as view:
+                while index != -1:
+                    try:
+                        line = str(view[start:index], "utf-8").strip()
+                    except UnicodeDecodeError:
+                        self.invalid_lines += 1
+                        _LOGGER.debug("Dropping line with invalid UTF-8 (%d bytes)", index - start)
+                    else:
+                        if line:
+                            lines.append(line)
+                    start = index + 1
+                    index = buffer.find(b"\n", start)
+            # One compaction per feed keeps the total work linear in bytes received
+            del buffer[:start]
+
+        if len(buffer) > self._max_line:
+            self.overflows += 1
+            _LOGGER.debug("Discarding %d bytes without a line terminator", len(buffer))
+            buffer.clear()
+        self._scan_from = len(buffer)
+        return lines
+
+
+def encode_command(command: Dict[str, Any]) -> bytes:
+    """Serialize a command exactly as it goes on the wire: JSON, CRLF, UTF-8."""
+    return (json.dumps(command) + "\r\n").encode("utf-8")
+
+
+# Parses one received line and raises ValueError on invalid JSON with either backend
+decode_message = orjson.loads if orjson is not None else json.loads
+
+
+class CommandTemplate:
+    """A command serialized once, with only its ``sn`` spliced in per request.
+
+    ``encode`` returns the same bytes ``encode_command`` would for the full
+    dict with that sn, because the fixed fields are produced by the very same
+    ``json.dumps`` call and the sn is a run of digits that needs no escaping.
+    """
+
+    # Placeholder that cannot occur in any other field of a command
+    _MARKER = "\x00sn\x00"
+
+    def __init__(self, cmd: int, msg: Dict[str, Any]) -> None:
+        self.cmd = cmd
+        encoded = encode_command({"cmd": cmd, "pv": 0, "sn": self._MARKER, "msg": msg})
+        marker = json.dumps(self._MARKER).encode("utf-8")
+        prefix, suffix = encoded.split(marker)
+        self._prefix = prefix + b'"'
+        self._suffix = b'"' + suffix
+
+    def encode(self, sn: str) -> bytes:
+        """Return the wire bytes of this command carrying ``sn``."""
+        return self._prefix + sn.encode("ascii") + self._suffix
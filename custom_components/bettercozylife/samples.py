@@ -0,0 +1,89 @@
+"""Fixed-size in-memory history of sensor readings."""
+from __future__ import annotations
+
+import math
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+
+class SampleRing:
+    """Ring buffer of timestamped readings backed by preallocated ``array('d')``.
+
+    Memory is fixed at ``capacity`` doubles per column (timestamp plus one per
+    field in ``fields``, usually a profile's ``sampled_keys``); once full, each
+    new sample overwrites the oldest. Timestamps must be monotonic. A field the
+    plug did not report is stored as NaN and left out of windows.
+    """
+
+    def __init__(self, capacity: int, fields: Sequence[str]) -> None:
+        self.capacity = max(int(capacity), 1)
+        self.fields = tuple(fields)
+        self._times = array("d", bytes(8 * self.capacity))
+        self._columns: Dict[str, array] = {
+            field: array("d", bytes(8 * self.capacity)) for field in self.fields
+        }
+        self._ordered = tuple(self._columns[field] for field in self.fields)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, now: float, values: Sequence[float]) -> None:
+        """Store one sample, its values in ``fields`` order, overwriting the oldest when full."""
+        index = self._next
+        self._times[index] = now
+        for column, value in zip(self._ordered, values):
+            column[index] = value
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def window(self, field: str, now: float, seconds: float) -> List[float]:
+        """Return the values of ``field`` sampled in the last ``seconds``, oldest first."""
+        column = self._columns[field]
+        times = self._times
+        since = now - seconds
+        values: List[float] = []
+        # Walk back from the newest sample; timestamps only grow, so stop at the first old one
+        index = self._next
+        for _ in range(self._count):
+            index = (index - 1) % self.capacity
+            if times[index] < since:
+                break
+            value = column[index]
+            if value == value:
+                values.append(value)
+        values.reverse()
+        return values
+
+    def oldest(self, now: float, seconds: float) -> Optional[float]:
+        """Return the time of the oldest sample in the last ``seconds``, or None if there is none."""
+        times = self._times
+        since = now - seconds
+        oldest = None
+        index = self._next
+        for _ in range(self._count):
+            index = (index - 1) % self.capacity
+            if times[index] < since:
+                break
+            oldest = times[index]
+        return oldest
+
+    def summary(self, field: str, now: float, seconds: float) -> Optional[Dict[str, float]]:
+        """Rolling statistics of ``field`` over the last ``seconds``; None if no sample is in it."""
+        return summarize(self.window(field, now, seconds))
+
+
+def summarize(values: List[float]) -> Optional[Dict[str, float]]:
+    """Return count, min, max, mean and nearest-rank p95 of ``values``, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(0.95 * len(ordered)) - 1, 0)
+    return {
+        "count": len(ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": math.fsum(ordered) / len(ordered),
+        "p95": ordered[rank],
+    }
@@ -0,0 +1,222 @@
+"""Shared poll scheduler for all BetterCozyLife coordinators."""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import random
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .const import (
+    ACTIVITY_POWER_DELTA,
+    ACTIVITY_POWER_RATIO,
+    DEFAULT_MAX_CONCURRENT_POLLS,
+    DEFAULT_POLL_INTERVAL,
+    POLL_BACKOFF_FACTOR,
+    POLL_JITTER,
+)
+
+if TYPE_CHECKING:
+    from .coordinator import CozyLifeCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+# Fractional part of the golden ratio: successive multiples spread evenly over [0, 1)
+_GOLDEN_FRACTION = 0.6180339887498949
+
+
+class AdaptivePollInterval:
+    """Poll interval that tightens on load activity and relaxes while readings stay flat.
+
+    A relay toggle or a significant power change drops the interval to the
+    minimum; every quiet sample stretches it by ``POLL_BACKOFF_FACTOR`` up to
+    the maximum.
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        initial: float = DEFAULT_POLL_INTERVAL,
+        relay_keys: Tuple[str, ...] = ("switch",),
+        power_key: Optional[str] = None,
+    ) -> None:
+        self.relay_keys = relay_keys
+        self.power_key = power_key
+        self.min_interval = max(float(min_interval), 1.0)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.value = min(max(float(initial), self.min_interval), self.max_interval)
+
+    def observe(self, previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> float:
+        """Update the interval from two consecutive parsed states and return it."""
+        if previous is not None:
+            if self._is_active(previous, current):
+                self.value = self.min_interval
+            else:
+                self.value = min(self.value * POLL_BACKOFF_FACTOR, self.max_interval)
+        return self.value
+
+    def _is_active(self, previous: Dict[str, Any], current: Dict[str, Any]) -> bool:
+        for key in self.relay_keys:
+            if previous.get(key) != current.get(key):
+                return True
+        if self.power_key is None:
+            return False
+        old = float(previous.get(self.power_key) or 0.0)
+        new = float(current.get(self.power_key) or 0.0)
+        threshold = max(ACTIVITY_POWER_DELTA, ACTIVITY_POWER_RATIO * max(abs(old), abs(new)))
+        return abs(new - old) > threshold
+
+
+@dataclass
+class _ScheduledDevice:
+    coordinator: CozyLifeCoordinator
+    generation: int
+    unsub_listener: CALLBACK_TYPE
+    # Loop time of the queued poll; None while a poll is in flight
+    due: Optional[float] = None
+
+
+class CozyLifePollScheduler:
+    """Poll every registered coordinator from one timer with bounded concurrency.
+
+    Coordinators are created without an ``update_interval``; this scheduler owns
+    the timing instead. New devices are phase-shifted across their interval so a
+    restart does not poll the whole fleet at once, every cycle is jittered, and
+    at most ``max_concurrent`` polls are in flight at any time. When an update
+    shortens a coordinator's ``poll_interval`` its queued poll is pulled forward.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT_POLLS,
+        jitter: float = POLL_JITTER,
+    ) -> None:
+        self.hass = hass
+        self._jitter = max(0.0, min(float(jitter), 0.5))
+        self._semaphore = asyncio.Semaphore(max(int(max_concurrent), 1))
+        self._devices: Dict[str, _ScheduledDevice] = {}
+        # (due, tiebreak, entry_id, generation); stale items are skipped on pop
+        self._queue: List[Tuple[float, int, str, int]] = []
+        self._counter = 0
+        self._slot = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_empty(self) -> bool:
+        """Return True when no coordinator is registered."""
+        return not self._devices
+
+    def async_register(self, coordinator: CozyLifeCoordinator, poll_now: bool = False) -> None:
+        """Start polling a coordinator, phase-shifted against the others.
+
+        With ``poll_now`` the first poll is due at once, e.g. because setup
+        skipped the first refresh; it still waits for a free poll slot.
+        """
+        entry_id = coordinator.entry.entry_id
+        self.async_unregister(coordinator)
+        self._counter += 1
+        self._devices[entry_id] = _ScheduledDevice(
+            coordinator,
+            self._counter,
+            coordinator.async_add_listener(partial(self._async_interval_changed, entry_id)),
+        )
+
+        offset = (self._slot * _GOLDEN_FRACTION) % 1.0
+        self._slot += 1
+        self._schedule(entry_id, 0.0 if poll_now else offset * coordinator.poll_interval)
+
+        if self._task is None:
+            self._task = self.hass.async_create_background_task(
+                self._async_run(), "bettercozylife poll scheduler"
+            )
+
+    def async_unregister(self, coordinator: CozyLifeCoordinator) -> None:
+        """Stop polling a coordinator; a poll already in flight is left to finish."""
+        device = self._devices.pop(coordinator.entry.entry_id, None)
+        if device is not None:
+            device.unsub_listener()
+
+    async def async_stop(self) -> None:
+        """Cancel the scheduler loop."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _schedule(self, entry_id: str, delay: float) -> None:
+        device = self._devices.get(entry_id)
+        if device is None:
+            return
+        # A new generation invalidates whatever was queued for this device before
+        self._counter += 1
+        device.generation = self._counter
+        device.due = self.hass.loop.time() + max(delay, 0.0)
+        wake = not self._queue or device.due < self._queue[0][0]
+        heapq.heappush(self._queue, (device.due, self._counter, entry_id, device.generation))
+        if wake:
+            self._wakeup.set()
+
+    @callback
+    def _async_interval_changed(self, entry_id: str) -> None:
+        """Pull a queued poll forward if the coordinator now wants a shorter interval."""
+        device = self._devices.get(entry_id)
+        if device is None or device.due is None:
+            return
+        delay = self._next_delay(device.coordinator)
+        if self.hass.loop.time() + delay < device.due:
+            self._schedule(entry_id, delay)
+
+    def _next_delay(self, coordinator: CozyLifeCoordinator) -> float:
+        interval = coordinator.poll_interval
+        return interval * random.uniform(1.0 - self._jitter, 1.0 + self._jitter)
+
+    async def _async_run(self) -> None:
+        while True:
+            if not self._queue:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            delay = self._queue[0][0] - self.hass.loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, entry_id, generation = heapq.heappop(self._queue)
+            device = self._devices.get(entry_id)
+            if device is None or device.generation != generation:
+                continue
+            device.due = None
+
+            # Waiting here holds back every later poll, which is the point
+            await self._semaphore.acquire()
+            self.hass.async_create_background_task(
+                self._async_poll(entry_id, device),
+                f"bettercozylife poll {device.coordinator.ip}",
+            )
+
+    async def _async_poll(self, entry_id: str, device: _ScheduledDevice) -> None:
+        coordinator = device.coordinator
+        try:
+            await coordinator.async_refresh()
+        except Exception as err:  # async_refresh handles its own errors; be defensive
+            _LOGGER.debug("Scheduled poll for %s raised: %s", coordinator.ip, err)
+        finally:
+            self._semaphore.release()
+            current = self._devices.get(entry_id)
+            if current is device:
+                self._schedule(entry_id, self._next_delay(coordinator))
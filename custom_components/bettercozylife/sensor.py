@@ -1,28 +1,55 @@
 """Platform for sensor integration using shared coordinator."""
 from homeassistant.components.sensor import (
+    RestoreSensor,
     SensorEntity,
     SensorDeviceClass,
     SensorStateClass,
 )
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.const import (
     CONF_NAME,
     CONF_IP_ADDRESS,
-    UnitOfPower,
-    UnitOfElectricCurrent,
-    UnitOfElectricPotential,
+    UnitOfEnergy,
+    UnitOfTime,
+    EntityCategory,
 )
 from homeassistant.helpers.entity import DeviceInfo
 
-from .const import DOMAIN, DEVICE_TYPE_SWITCH, CONF_DEVICE_TYPE
+from .const import (
+    DOMAIN,
+    DEFAULT_DEADBAND,
+    CONF_MAX_STATE_AGE,
+    DEFAULT_MAX_STATE_AGE,
+)
 from .coordinator import CozyLifeCoordinator
+from .profiles import SensorSpec
 import logging
 
 _LOGGER = logging.getLogger(__name__)
 
+STATS = ("min", "max", "mean", "p95")
+
+# Diagnostic sensors: (key, name, unit, device class, state class, enabled by default, value)
+METRIC_SENSORS = (
+    ("latency", "Latency", UnitOfTime.MILLISECONDS, SensorDeviceClass.DURATION,
+     SensorStateClass.MEASUREMENT, False,
+     lambda c: round(c.device.metrics.rtt_smoothed * 1000, 1) if c.device.metrics.rtt_smoothed is not None else None),
+    ("timeouts", "Timeouts", None, None, SensorStateClass.TOTAL_INCREASING, False,
+     lambda c: c.device.metrics.timeouts),
+    ("reconnects", "Reconnects", None, None, SensorStateClass.TOTAL_INCREASING, False,
+     lambda c: c.device.metrics.reconnects),
+    ("resets", "Connection resets", None, None, SensorStateClass.TOTAL_INCREASING, False,
+     lambda c: c.device.metrics.resets),
+    ("invalid_messages", "Invalid messages", None, None, SensorStateClass.TOTAL_INCREASING, False,
+     lambda c: c.device.metrics.invalid_messages),
+    ("backoff_time", "Backoff time", UnitOfTime.SECONDS, SensorDeviceClass.DURATION,
+     SensorStateClass.TOTAL_INCREASING, False,
+     lambda c: round(c.device.breaker.backoff_seconds, 1)),
+)
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -31,17 +58,24 @@ async def async_setup_entry(
 ) -> None:
     """Set up the BetterCozyLife sensors via coordinator."""
     config = config_entry.data
-
-    if config[CONF_DEVICE_TYPE] != DEVICE_TYPE_SWITCH:
-        return
-
     coordinator: CozyLifeCoordinator = hass.data[DOMAIN][config_entry.entry_id]
-
-    entities = [
-        BetterCozyLifePowerSensor(coordinator, config),
-        BetterCozyLifeCurrentSensor(coordinator, config),
-        BetterCozyLifeVoltageSensor(coordinator, config),
-    ]
+    profile = coordinator.profile
+
+    # Only create sensors for the attributes this plug actually has
+    specs = [spec for spec in profile.sensors if coordinator.supports(profile.dpid(spec.key))]
+    entities = [BetterCozyLifeMeasurementSensor(coordinator, config, spec) for spec in specs]
+    if profile.energy_key is not None and coordinator.supports(profile.dpid(profile.energy_key)):
+        entities.append(BetterCozyLifeEnergySensor(coordinator, config))
+    entities.extend(
+        BetterCozyLifeStatisticSensor(coordinator, config, spec, stat)
+        for spec in specs
+        if spec.statistics
+        for stat in STATS
+    )
+    entities.extend(
+        BetterCozyLifeMetricSensor(coordinator, config, *description)
+        for description in METRIC_SENSORS
+    )
     async_add_entities(entities)
 
 
@@ -51,13 +85,14 @@ class BaseBetterCozyLifeSensor(CoordinatorEntity[CozyLifeCoordinator], SensorEnt
     def __init__(self, coordinator: CozyLifeCoordinator, config: dict, name_suffix: str):
         super().__init__(coordinator)
         self._ip = config[CONF_IP_ADDRESS]
+        self._identity = coordinator.identity
         base_name = config.get(CONF_NAME, f"BetterCozyLife {self._ip}")
         self._attr_name = f"{base_name} {name_suffix}"
         self._attr_device_info = DeviceInfo(
-            identifiers={(DOMAIN, self._ip)},
+            identifiers={(DOMAIN, self._identity)},
             name=base_name,
             manufacturer="CozyLife",
-            model="Smart Switch",
+            model=coordinator.profile.model,
             sw_version="2.1",
         )
 
@@ -68,43 +103,153 @@ class BaseBetterCozyLifeSensor(CoordinatorEntity[CozyLifeCoordinator], SensorEnt
         return super().available
 
 
-class BetterCozyLifePowerSensor(BaseBetterCozyLifeSensor):
-    def __init__(self, coordinator: CozyLifeCoordinator, config: dict):
-        super().__init__(coordinator, config, "Power")
-        self._attr_unique_id = f"bettercozylife_power_{self._ip}"
-        self._attr_device_class = SensorDeviceClass.POWER
-        self._attr_native_unit_of_measurement = UnitOfPower.WATT
-        self._attr_state_class = SensorStateClass.MEASUREMENT
+class BetterCozyLifeMeasurementSensor(BaseBetterCozyLifeSensor, RestoreSensor):
+    """Measurement sensor described by a profile ``SensorSpec``.
+
+    Skips state writes for insignificant changes: a new state is written when
+    the reading moves by at least the deadband set in the spec's option, when
+    availability changes, or when the last written state is older than the
+    max state age. Until the first poll the saved reading is shown.
+    """
+
+    def __init__(self, coordinator: CozyLifeCoordinator, config: dict, spec: SensorSpec):
+        super().__init__(coordinator, config, spec.name)
+        self._key = spec.key
+        self._attr_unique_id = f"bettercozylife_{spec.key}_{self._identity}"
+        self._attr_device_class = spec.device_class
+        self._attr_native_unit_of_measurement = spec.unit
+        self._attr_state_class = spec.state_class
+        options = coordinator.entry.options
+        try:
+            self._deadband = float(options.get(spec.deadband_option, DEFAULT_DEADBAND))
+            self._max_state_age = float(options.get(CONF_MAX_STATE_AGE, DEFAULT_MAX_STATE_AGE))
+        except (TypeError, ValueError):
+            self._deadband = DEFAULT_DEADBAND
+            self._max_state_age = float(DEFAULT_MAX_STATE_AGE)
+        self._written_value = None
+        self._written_available = None
+        self._written_at = 0.0
+        self._restored_value = None
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        last = await self.async_get_last_sensor_data()
+        if last is not None and last.native_value is not None:
+            try:
+                self._restored_value = float(last.native_value)
+            except (TypeError, ValueError):
+                _LOGGER.debug("Ignoring unusable saved reading: %s", last.native_value)
 
     @property
     def native_value(self):
         data = self.coordinator.data or {}
-        return data.get("power")
+        if self._key not in data:
+            return self._restored_value
+        return data[self._key]
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        value = self.native_value
+        available = self.available
+        now = self.hass.loop.time()
+        if (
+            available == self._written_available
+            and value is not None
+            and self._written_value is not None
+            and abs(value - self._written_value) < self._deadband
+            and now - self._written_at < self._max_state_age
+        ):
+            return
+        self._written_value = value
+        self._written_available = available
+        self._written_at = now
+        self.async_write_ha_state()
+
+
+class BetterCozyLifeEnergySensor(BaseBetterCozyLifeSensor, RestoreSensor):
+    """Energy used, integrated by the coordinator from the power readings.
+
+    The total is restored from Home Assistant's saved entity state, so it
+    survives restarts without writing anything beyond the regular state.
+    """
 
-
-class BetterCozyLifeCurrentSensor(BaseBetterCozyLifeSensor):
     def __init__(self, coordinator: CozyLifeCoordinator, config: dict):
-        super().__init__(coordinator, config, "Current")
-        self._attr_unique_id = f"bettercozylife_current_{self._ip}"
-        self._attr_device_class = SensorDeviceClass.CURRENT
-        self._attr_native_unit_of_measurement = UnitOfElectricCurrent.AMPERE
-        self._attr_state_class = SensorStateClass.MEASUREMENT
+        super().__init__(coordinator, config, "Energy")
+        self._attr_unique_id = f"bettercozylife_energy_{self._identity}"
+        self._attr_device_class = SensorDeviceClass.ENERGY
+        self._attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
+        self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+        self._attr_suggested_display_precision = 3
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        last = await self.async_get_last_sensor_data()
+        if last is not None and last.native_value is not None:
+            try:
+                self.coordinator.energy.restore(float(last.native_value))
+            except (TypeError, ValueError):
+                _LOGGER.debug("Ignoring unusable saved energy total: %s", last.native_value)
 
     @property
     def native_value(self):
-        data = self.coordinator.data or {}
-        return data.get("current")
+        return round(self.coordinator.energy.total_kwh, 6)
 
 
-class BetterCozyLifeVoltageSensor(BaseBetterCozyLifeSensor):
-    def __init__(self, coordinator: CozyLifeCoordinator, config: dict):
-        super().__init__(coordinator, config, "Voltage")
-        self._attr_unique_id = f"bettercozylife_voltage_{self._ip}"
-        self._attr_device_class = SensorDeviceClass.VOLTAGE
-        self._attr_native_unit_of_measurement = UnitOfElectricPotential.VOLT
+class BetterCozyLifeStatisticSensor(BaseBetterCozyLifeSensor):
+    """Rolling statistic of one field over the coordinator's sample history.
+
+    Disabled by default; enabling e.g. the power maximum shows short spikes
+    that the regular power sensor only catches when a poll happens to land
+    on them, without recording every sample.
+    """
+
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, coordinator: CozyLifeCoordinator, config: dict, spec: SensorSpec, stat: str):
+        super().__init__(coordinator, config, f"{spec.name} {stat}")
+        self._field = spec.key
+        self._stat = stat
+        self._attr_unique_id = f"bettercozylife_{spec.key}_{stat}_{self._identity}"
+        self._attr_device_class = spec.device_class
+        self._attr_native_unit_of_measurement = spec.unit
         self._attr_state_class = SensorStateClass.MEASUREMENT
 
     @property
     def native_value(self):
-        data = self.coordinator.data or {}
-        return data.get("voltage")
+        summary = self.coordinator.rolling_stats(self._field)
+        return summary[self._stat] if summary else None
+
+    @property
+    def extra_state_attributes(self):
+        summary = self.coordinator.rolling_stats(self._field)
+        return {
+            "window": self.coordinator.stats_window,
+            "samples": summary["count"] if summary else 0,
+        }
+
+
+class BetterCozyLifeMetricSensor(BaseBetterCozyLifeSensor):
+    """Connection health counter of a plug, from its DeviceMetrics and circuit breaker.
+
+    Always available: the numbers matter most while the plug is not answering.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, coordinator: CozyLifeCoordinator, config: dict, key: str, name: str,
+                 unit, device_class, state_class, enabled: bool, value_fn):
+        super().__init__(coordinator, config, name)
+        self._value_fn = value_fn
+        self._attr_unique_id = f"bettercozylife_{key}_{self._identity}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
+        self._attr_entity_registry_enabled_default = enabled
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @property
+    def native_value(self):
+        return self._value_fn(self.coordinator)
@@ -0,0 +1,138 @@
+"""Services for the BetterCozyLife integration."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Tuple
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.helpers import config_validation as cv, entity_registry as er
+from homeassistant.helpers.service import async_extract_referenced_entity_ids
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    SERVICE_SET_MANY,
+    ATTR_STATE,
+    ATTR_MAX_CONCURRENCY,
+    DEFAULT_SET_MANY_CONCURRENCY,
+    SERVICE_TRACE,
+    ATTR_DURATION,
+    DEFAULT_TRACE_DURATION,
+    MAX_TRACE_DURATION,
+    TRACE_DIR,
+)
+from .coordinator import CozyLifeCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+SET_MANY_SCHEMA = vol.Schema(
+    {
+        **cv.ENTITY_SERVICE_FIELDS,
+        vol.Required(ATTR_STATE): cv.boolean,
+        vol.Optional(ATTR_MAX_CONCURRENCY, default=DEFAULT_SET_MANY_CONCURRENCY): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=256)
+        ),
+    }
+)
+
+TRACE_SCHEMA = vol.Schema(
+    {
+        **cv.ENTITY_SERVICE_FIELDS,
+        vol.Optional(ATTR_DURATION, default=DEFAULT_TRACE_DURATION): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=MAX_TRACE_DURATION)
+        ),
+    }
+)
+
+
+async def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the integration services."""
+
+    async def _async_set_many(call: ServiceCall) -> ServiceResponse:
+        """Switch many plugs at once with a bounded number of SETs in flight."""
+        state: bool = call.data[ATTR_STATE]
+        selected = async_extract_referenced_entity_ids(hass, call)
+        entity_registry = er.async_get(hass)
+
+        # Each switch entity is one relay: its coordinator and profile switch key
+        targets: Dict[str, Tuple[CozyLifeCoordinator, str]] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        for entity_id in sorted(selected.referenced | selected.indirectly_referenced):
+            entity_entry = entity_registry.async_get(entity_id)
+            if entity_entry is None or entity_entry.platform != DOMAIN or entity_entry.domain != "switch":
+                continue
+            coordinator = hass.data.get(DOMAIN, {}).get(entity_entry.config_entry_id)
+            if not isinstance(coordinator, CozyLifeCoordinator):
+                results[entity_id] = {"success": False, "error": "not_loaded"}
+                continue
+            key = coordinator.switch_entities.get(entity_id)
+            if key is None:
+                results[entity_id] = {"success": False, "error": "unknown_switch"}
+                continue
+            targets[entity_id] = (coordinator, key)
+
+        semaphore = asyncio.Semaphore(call.data[ATTR_MAX_CONCURRENCY])
+
+        async def _async_set(entity_id: str, coordinator: CozyLifeCoordinator, key: str) -> None:
+            async with semaphore:
+                try:
+                    ok = await coordinator.async_set_switch(state, key)
+                except Exception as err:
+                    _LOGGER.debug("set_many failed for %s: %s", entity_id, err)
+                    ok = False
+            results[entity_id] = {"success": ok}
+
+        started = time.monotonic()
+        await asyncio.gather(*(
+            _async_set(entity_id, coordinator, key) for entity_id, (coordinator, key) in targets.items()
+        ))
+        succeeded = sum(1 for result in results.values() if result["success"])
+        _LOGGER.debug(
+            "set_many switched %d/%d plugs %s in %.2fs",
+            succeeded, len(results), "on" if state else "off", time.monotonic() - started,
+        )
+        return {
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        }
+
+    async def _async_trace(call: ServiceCall) -> ServiceResponse:
+        """Record the protocol traffic of the targeted plugs to trace files."""
+        selected = async_extract_referenced_entity_ids(hass, call)
+        entity_registry = er.async_get(hass)
+        coordinators: Dict[str, CozyLifeCoordinator] = {}
+        for entity_id in selected.referenced | selected.indirectly_referenced:
+            entity_entry = entity_registry.async_get(entity_id)
+            if entity_entry is None or entity_entry.platform != DOMAIN:
+                continue
+            coordinator = hass.data.get(DOMAIN, {}).get(entity_entry.config_entry_id)
+            if isinstance(coordinator, CozyLifeCoordinator):
+                coordinators[entity_entry.config_entry_id] = coordinator
+
+        stamp = dt_util.now().strftime("%Y%m%d_%H%M%S")
+        traces: Dict[str, str] = {}
+        for coordinator in coordinators.values():
+            name = f"{coordinator.identity}_{stamp}.jsonl".replace(":", "_")
+            path = hass.config.path(TRACE_DIR, name)
+            await coordinator.async_start_trace(path, call.data[ATTR_DURATION])
+            traces[coordinator.identity] = path
+        return {"traces": traces}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_MANY,
+        _async_set_many,
+        schema=SET_MANY_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_TRACE,
+        _async_trace,
+        schema=TRACE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
@@ -4,11 +4,13 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
-from homeassistant.const import CONF_NAME, CONF_IP_ADDRESS
+from homeassistant.const import CONF_NAME, CONF_IP_ADDRESS, STATE_ON
 from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.restore_state import RestoreEntity
 
-from .const import DOMAIN, DEVICE_TYPE_SWITCH, CONF_DEVICE_TYPE
+from .const import DOMAIN
 from .coordinator import CozyLifeCoordinator
+from .profiles import SwitchSpec
 import logging
 
 _LOGGER = logging.getLogger(__name__)
@@ -19,37 +21,53 @@ async def async_setup_entry(
     config_entry: ConfigEntry,
     async_add_entities: AddEntitiesCallback,
 ) -> None:
-    """Set up the BetterCozyLife Switch via coordinator."""
+    """Set up a BetterCozyLife Switch per relay of the device profile via coordinator."""
     config = config_entry.data
-
-    if config[CONF_DEVICE_TYPE] != DEVICE_TYPE_SWITCH:
-        return
-
     coordinator: CozyLifeCoordinator = hass.data[DOMAIN][config_entry.entry_id]
-    async_add_entities([BetterCozyLifeSwitch(coordinator, config)])
+    async_add_entities(
+        BetterCozyLifeSwitch(coordinator, config, spec) for spec in coordinator.profile.switches
+    )
 
 
-class BetterCozyLifeSwitch(CoordinatorEntity[CozyLifeCoordinator], SwitchEntity):
-    """Representation of a BetterCozyLife Switch using coordinator."""
+class BetterCozyLifeSwitch(CoordinatorEntity[CozyLifeCoordinator], SwitchEntity, RestoreEntity):
+    """Representation of a BetterCozyLife Switch using coordinator.
+
+    Until the first poll the saved state is shown, so a fast-started entry
+    does not come up as off.
+    """
 
     _attr_has_entity_name = True
 
-    def __init__(self, coordinator: CozyLifeCoordinator, config: dict):
+    def __init__(self, coordinator: CozyLifeCoordinator, config: dict, spec: SwitchSpec):
         super().__init__(coordinator)
-        self._name = config.get(CONF_NAME, f"BetterCozyLife Switch {config[CONF_IP_ADDRESS]}")
+        self._device_name = config.get(CONF_NAME, f"BetterCozyLife Switch {config[CONF_IP_ADDRESS]}")
+        self._name = f"{self._device_name} {spec.name}" if spec.name else self._device_name
         self._ip = config[CONF_IP_ADDRESS]
+        self._identity = coordinator.identity
+        self._key = spec.key
+        self._restored_is_on = False
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        # Lets services find the relay behind an entity id
+        entity_id = self.entity_id
+        self.coordinator.switch_entities[entity_id] = self._key
+        self.async_on_remove(lambda: self.coordinator.switch_entities.pop(entity_id, None))
+        last = await self.async_get_last_state()
+        if last is not None:
+            self._restored_is_on = last.state == STATE_ON
 
     @property
     def unique_id(self):
-        return f"bettercozylife_switch_{self._ip}"
+        return f"bettercozylife_{self._key}_{self._identity}"
 
     @property
     def device_info(self):
         return DeviceInfo(
-            identifiers={(DOMAIN, self._ip)},
-            name=self._name,
+            identifiers={(DOMAIN, self._identity)},
+            name=self._device_name,
             manufacturer="CozyLife",
-            model="Smart Switch",
+            model=self.coordinator.profile.model,
             sw_version="2.1",
         )
 
@@ -60,7 +78,9 @@ class BetterCozyLifeSwitch(CoordinatorEntity[CozyLifeCoordinator], SwitchEntity)
     @property
     def is_on(self):
         data = self.coordinator.data or {}
-        return bool(data.get("switch", False))
+        if self._key not in data:
+            return self._restored_is_on
+        return bool(data[self._key])
 
     @property
     def available(self):
@@ -70,23 +90,18 @@ class BetterCozyLifeSwitch(CoordinatorEntity[CozyLifeCoordinator], SwitchEntity)
         return super().available
 
     async def async_turn_on(self, **kwargs):
-        try:
-            ok = await self.hass.async_add_executor_job(self.coordinator.device.send_command, True)
-            if ok:
-                _LOGGER.info("Successfully turned on switch: %s", self._name)
-                await self.coordinator.async_request_refresh()
-            else:
-                _LOGGER.warning("Failed to turn on switch: %s", self._name)
-        except Exception as e:
-            _LOGGER.error("Error turning on switch %s: %s", self._name, e)
+        await self._async_switch(True)
 
     async def async_turn_off(self, **kwargs):
+        await self._async_switch(False)
+
+    async def _async_switch(self, state: bool):
+        action = "on" if state else "off"
         try:
-            ok = await self.hass.async_add_executor_job(self.coordinator.device.send_command, False)
+            ok = await self.coordinator.async_set_switch(state, self._key)
             if ok:
-                _LOGGER.info("Successfully turned off switch: %s", self._name)
-                await self.coordinator.async_request_refresh()
+                _LOGGER.info("Successfully turned %s switch: %s", action, self._name)
             else:
-                _LOGGER.warning("Failed to turn off switch: %s", self._name)
+                _LOGGER.warning("Failed to turn %s switch: %s", action, self._name)
         except Exception as e:
-            _LOGGER.error("Error turning off switch %s: %s", self._name, e)
+            _LOGGER.error("Error turning %s switch %s: %s", action, self._name, e)
@@ -0,0 +1,232 @@
+"""Record the byte stream to a CozyLife plug and replay it as a fake transport.
+
+A trace is JSONL: a header line, then one event per line with its offset in
+seconds from the start of the recording, its kind and, for sent and received
+bytes, the data as a latin-1 string (lossless for any byte, readable for the
+JSON frames the plug speaks). Received data is stored as the chunks the socket
+returned, so split lines and garbage are replayed exactly as they arrived.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TRACE_VERSION = 1
+
+# Event kinds
+EVENT_OPEN = "open"
+EVENT_CONNECT_FAIL = "connect_fail"
+EVENT_TX = "tx"
+EVENT_RX = "rx"
+# The plug closed the stream, or reset it
+EVENT_EOF = "eof"
+EVENT_RESET = "reset"
+# We closed the stream
+EVENT_CLOSE = "close"
+
+# (offset in seconds, kind, data)
+TraceEvent = Tuple[float, str, bytes]
+
+_SN_PATTERN = re.compile(rb'"sn"\s*:\s*"?(\d+)')
+
+
+class TraceRecorder:
+    """Collects every connect, sent frame and received chunk of one plug in memory.
+
+    Nothing touches the disk while recording; ``save`` writes the trace in one
+    go, so it can run in an executor. Recording stops after ``max_events``
+    events and marks the trace truncated, which bounds its memory.
+    """
+
+    def __init__(
+        self,
+        ip: str,
+        port: int,
+        max_events: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ip = ip
+        self.port = port
+        self.max_events = max_events
+        self.events: List[TraceEvent] = []
+        self.truncated = False
+        self._clock = clock
+        self._started = clock()
+        self._started_wall = time.time()
+
+    def record(self, kind: str, data: bytes = b"") -> None:
+        if len(self.events) >= self.max_events:
+            self.truncated = True
+            return
+        self.events.append((self._clock() - self._started, kind, bytes(data)))
+
+    def lines(self) -> Iterator[str]:
+        yield json.dumps({
+            "trace": TRACE_VERSION,
+            "ip": self.ip,
+            "port": self.port,
+            "started": self._started_wall,
+            "truncated": self.truncated,
+        })
+        for offset, kind, data in self.events:
+            event: Dict[str, Any] = {"t": round(offset, 6), "e": kind}
+            if data:
+                event["d"] = data.decode("latin-1")
+            yield json.dumps(event)
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            for line in self.lines():
+                file.write(line + "\n")
+
+
+def load_trace(path: str) -> Tuple[Dict[str, Any], List[TraceEvent]]:
+    """Read a trace file; returns its header and events."""
+    with open(path, encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        if header.get("trace") != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version in {path}: {header.get('trace')}")
+        events = []
+        for line in file:
+            if line.strip():
+                event = json.loads(line)
+                events.append((float(event["t"]), event["e"], event.get("d", "").encode("latin-1")))
+    return header, events
+
+
+def _sn(data: bytes) -> Optional[bytes]:
+    match = _SN_PATTERN.search(data)
+    return match.group(1) if match else None
+
+
+class _ReplaySession:
+    """The events of one recorded connection, from its open to the next one."""
+
+    def __init__(self, opened: bool, started: float) -> None:
+        self.opened = opened
+        # (offset, sent frame, events up to the next tx): first the events
+        # between the open and the first tx, then one group per tx
+        self.groups: List[Tuple[float, Optional[bytes], List[TraceEvent]]] = [(started, None, [])]
+
+    def add(self, event: TraceEvent) -> None:
+        if event[1] == EVENT_TX:
+            self.groups.append((event[0], event[2], []))
+        else:
+            self.groups[-1][2].append(event)
+
+
+class _ReplayWriter:
+    """Stands in for the StreamWriter: every write releases the replies recorded after the matching tx."""
+
+    def __init__(self, replayer: TraceReplayer, session: _ReplaySession, reader: asyncio.StreamReader,
+                 opened_at: float) -> None:
+        self._replayer = replayer
+        self._session = session
+        self._reader = reader
+        self._next_group = 1
+        self._sns: Dict[bytes, bytes] = {}
+        self._closing = False
+        self._tasks: List[asyncio.Task] = []
+        start, _, events = session.groups[0]
+        self._schedule(start, opened_at, events)
+
+    def _schedule(self, anchor: float, anchor_time: float, events: List[TraceEvent]) -> None:
+        if events:
+            self._tasks.append(asyncio.get_running_loop().create_task(
+                self._feed(anchor, anchor_time, events)
+            ))
+
+    async def _feed(self, anchor: float, anchor_time: float, events: List[TraceEvent]) -> None:
+        loop = asyncio.get_running_loop()
+        speed = self._replayer.speed
+        for offset, kind, data in events:
+            if speed > 0:
+                delay = anchor_time + (offset - anchor) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if self._closing:
+                return
+            if kind == EVENT_RX:
+                for recorded, live in self._sns.items():
+                    data = data.replace(recorded, live)
+                self._reader.feed_data(data)
+            elif kind == EVENT_EOF:
+                self._reader.feed_eof()
+                return
+            elif kind == EVENT_RESET:
+                self._reader.set_exception(ConnectionResetError("Connection reset (replayed)"))
+                return
+
+    def write(self, data: bytes) -> None:
+        if self._closing:
+            raise ConnectionError("Replay transport is closed")
+        self._replayer.sent.append(bytes(data))
+        if self._next_group >= len(self._session.groups):
+            # More requests than the recording had: the plug stays silent
+            return
+        anchor, recorded, events = self._session.groups[self._next_group]
+        self._next_group += 1
+        # Replies carry the sn of the request; swap the recorded one for ours
+        recorded_sn, live_sn = _sn(recorded or b""), _sn(data)
+        if recorded_sn and live_sn and recorded_sn != live_sn:
+            self._sns[recorded_sn] = live_sn
+        self._schedule(anchor, asyncio.get_running_loop().time(), events)
+
+    async def drain(self) -> None:
+        return None
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        # There is no socket, so the pool's keepalive setup is skipped
+        return default
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self) -> None:
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+
+    async def wait_closed(self) -> None:
+        return None
+
+
+class TraceReplayer:
+    """Serves a recorded trace to ``CozyLifeConnection`` in place of a socket.
+
+    Pass ``open_connection`` to the device or connection. Each call replays
+    the next recorded connection, or fails like the recorded connect attempt
+    did. Received data is released after each sent frame, at the recorded
+    delays divided by ``speed``; a speed of 0 releases it immediately. Which
+    request is sent does not matter, only how many: the n-th write of a
+    connection gets what the plug sent after the n-th recorded one.
+    """
+
+    def __init__(self, events: List[TraceEvent], speed: float = 1.0) -> None:
+        self.speed = speed
+        self.sent: List[bytes] = []
+        self._sessions: List[_ReplaySession] = []
+        for event in events:
+            if event[1] in (EVENT_OPEN, EVENT_CONNECT_FAIL):
+                self._sessions.append(_ReplaySession(event[1] == EVENT_OPEN, event[0]))
+            elif self._sessions:
+                self._sessions[-1].add(event)
+        self._next_session = 0
+
+    @property
+    def exhausted(self) -> bool:
+        return self._next_session >= len(self._sessions)
+
+    async def open_connection(self, host: str, port: int, **kwargs: Any):
+        if self.exhausted:
+            raise ConnectionRefusedError("Trace has no more recorded connections")
+        session = self._sessions[self._next_session]
+        self._next_session += 1
+        if not session.opened:
+            raise ConnectionRefusedError("Connect failed (replayed)")
+        reader = asyncio.StreamReader()
+        writer = _ReplayWriter(self, session, reader, asyncio.get_running_loop().time())
+        return reader, writer
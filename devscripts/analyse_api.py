@@ -1,171 +1,291 @@
+import argparse
+import asyncio
 import json
-import socket
-import time
 import logging
-from typing import Dict, List, Any, Optional
-import itertools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cozylife_client import CozyLifeClient
 
 logging.basicConfig(level=logging.INFO)
 _LOGGER = logging.getLogger(__name__)
 
+CMD_INFO = 0
+CMD_QUERY = 2
+CMD_SET = 3
+KNOWN_COMMANDS = {CMD_INFO: "INFO", CMD_QUERY: "QUERY", CMD_SET: "SET"}
+SET_TEST_VALUES = [0, 1, 255, 1000, 65535]  # Common values to test
+
+Probe = Callable[[CozyLifeClient], Awaitable[Dict[str, Any]]]
+
+
+class RateLimiter:
+    """Spaces requests over all connections to at most ``rate`` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Checkpoint:
+    """Append-only JSONL log of finished probes; loading it again resumes the run
+
+    Every line is one probe result keyed like ``query:27``. A line cut short by
+    an interrupted run is ignored and its probe simply runs again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.results: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                        self.results[result['key']] = result
+                    except (ValueError, KeyError, TypeError):
+                        _LOGGER.warning(f"Skipping unreadable checkpoint line: {line[:80]!r}")
+            _LOGGER.info(f"Resuming from {path}: {len(self.results)} probes already done")
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.results.get(key)
+
+    def record(self, key: str, result: Dict[str, Any]):
+        result = {'key': key, 'time': round(time.time(), 3), **result}
+        self.results[key] = result
+        self._file.write(json.dumps(result) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def reply_data(reply: Optional[dict]) -> Optional[Dict[str, Any]]:
+    msg = reply.get('msg') if reply else None
+    data = msg.get('data') if isinstance(msg, dict) else None
+    return data if isinstance(data, dict) else None
+
+
 class CozyLifeAnalyzer:
-    def __init__(self, ip: str, port: int = 5555):
+    """Probes a plug's attributes and commands over several connections at once
+
+    Probes are shared by ``connections`` workers, each with its own
+    reconnecting client, and rate limited across all of them. Every finished
+    probe goes to the checkpoint file, so an interrupted run picks up where
+    it stopped. The result doubles as a capability profile: ``capabilities``
+    is the attribute list the integration caches for a plug.
+    """
+
+    def __init__(self, ip: str, port: int = 5555, connections: int = 4, rate: float = 20.0,
+                 timeout: float = 3.0, checkpoint: Optional[str] = None, max_attr: int = 255,
+                 max_cmd: int = 19, probe_set: bool = True, retry_timeouts: bool = False):
         self.ip = ip
         self.port = port
-        self.socket = None
-        self.device_info = {}
-        self.discovered_commands = {}
-        self.known_commands = {0: "INFO", 2: "QUERY", 3: "SET"}
-        
-    def connect(self) -> bool:
-        """Establish connection to device"""
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(3)
-            self.socket.connect((self.ip, self.port))
+        self.clients = [CozyLifeClient(ip, port, timeout) for _ in range(max(connections, 1))]
+        self.limiter = RateLimiter(rate)
+        self.checkpoint = Checkpoint(checkpoint or f"cozylife_analysis_{ip}.jsonl")
+        self.max_attr = max_attr
+        self.max_cmd = max_cmd
+        self.probe_set = probe_set
+        self.retry_timeouts = retry_timeouts
+
+    async def _request(self, client: CozyLifeClient, cmd: int, msg: Dict[str, Any]) -> Optional[dict]:
+        await self.limiter.wait()
+        return await client.request(cmd, msg)
+
+    def _pending(self, key: str) -> bool:
+        result = self.checkpoint.get(key)
+        if result is None:
             return True
-        except Exception as e:
-            _LOGGER.error(f"Connection failed: {e}")
-            return False
-
-    def _get_package(self, cmd: int, payload: dict) -> bytes:
-        """Generate command package"""
-        sn = str(int(round(time.time() * 1000)))
-        message = {
-            'pv': 0,
-            'cmd': cmd,
-            'sn': sn,
-            'msg': payload
-        }
-        
-        if cmd == 3:  # SET command
-            message['msg'] = {
-                'attr': [int(k) for k in payload.keys()],
-                'data': payload
-            }
-        elif cmd == 2:  # QUERY command
-            message['msg'] = {'attr': [0]}
-            
-        return bytes(json.dumps(message) + "\r\n", encoding='utf8')
-
-    def _send_command(self, cmd: int, payload: dict) -> Optional[dict]:
-        """Send command and get response"""
-        try:
-            package = self._get_package(cmd, payload)
-            self.socket.send(package)
-            response = self.socket.recv(1024)
-            return json.loads(response.strip())
-        except Exception as e:
-            _LOGGER.error(f"Command failed: {e}")
-            return None
-
-    def get_device_info(self) -> Dict:
-        """Get basic device information"""
-        response = self._send_command(0, {})
-        if response and 'msg' in response:
-            self.device_info = response['msg']
-            _LOGGER.info(f"Device Info: {json.dumps(self.device_info, indent=2)}")
-            return self.device_info
-        return {}
-
-    def analyze_query_attributes(self) -> Dict:
-        """Test different attribute combinations for QUERY command"""
-        discovered_attrs = {}
-        
-        # Try individual attributes 0-255
-        for attr in range(256):
-            payload = {'attr': [attr]}
-            response = self._send_command(2, payload)
-            if response and 'msg' in response and 'data' in response['msg']:
-                discovered_attrs[attr] = response['msg']['data']
-                _LOGGER.info(f"Found valid attribute {attr}: {response['msg']['data']}")
-                
-        return discovered_attrs
-
-    def analyze_set_commands(self, known_attrs: Dict) -> Dict:
-        """Test SET commands with discovered attributes"""
-        set_results = {}
-        test_values = [0, 1, 255, 1000, 65535]  # Common values to test
-        
-        for attr in known_attrs.keys():
-            attr_results = {}
-            for value in test_values:
-                payload = {str(attr): value}
-                response = self._send_command(3, payload)
-                if response and response.get('res') == 0:
-                    attr_results[value] = True
+        return self.retry_timeouts and result.get('timeout', False)
+
+    async def _run(self, phase: str, probes: List[Tuple[str, Probe]]):
+        """Run probes on all connections and record each result in the checkpoint"""
+        todo = [(key, probe) for key, probe in probes if self._pending(key)]
+        _LOGGER.info(f"{phase}: {len(todo)} of {len(probes)} probes to run")
+        if not todo:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in todo:
+            queue.put_nowait(item)
+        done = 0
+        failed = 0
+
+        async def worker(client: CozyLifeClient):
+            nonlocal done, failed
+            while not queue.empty():
+                key, probe = queue.get_nowait()
+                try:
+                    result = await probe(client)
+                except ConnectionError as e:
+                    # Left out of the checkpoint so a resumed run tries again
+                    _LOGGER.warning(f"{key}: {e}")
+                    failed += 1
+                    continue
+                self.checkpoint.record(key, result)
+                done += 1
+                if done % 32 == 0:
+                    _LOGGER.info(f"{phase}: {done}/{len(todo)} done")
+
+        await asyncio.gather(*(worker(client) for client in self.clients))
+        _LOGGER.info(f"{phase}: {done} done, {failed} failed")
+
+    async def _probe_info(self, client: CozyLifeClient) -> Dict[str, Any]:
+        reply = await self._request(client, CMD_INFO, {})
+        msg = reply.get('msg') if reply else None
+        return {'info': msg if isinstance(msg, dict) else None, 'timeout': reply is None}
+
+    def _query_probe(self, attr: int) -> Probe:
+        async def probe(client: CozyLifeClient) -> Dict[str, Any]:
+            reply = await self._request(client, CMD_QUERY, {'attr': [attr]})
+            return {'attr': attr, 'data': reply_data(reply), 'timeout': reply is None}
+        return probe
+
+    def _set_probe(self, attr: int, original: Any) -> Probe:
+        async def probe(client: CozyLifeClient) -> Dict[str, Any]:
+            accepted = {}
+            for value in SET_TEST_VALUES:
+                reply = await self._request(client, CMD_SET, {'attr': [attr], 'data': {str(attr): value}})
+                accepted[str(value)] = reply is not None and reply.get('res') == 0
+                if accepted[str(value)]:
                     _LOGGER.info(f"SET attr {attr} = {value} succeeded")
-                else:
-                    attr_results[value] = False
-                    
-            set_results[attr] = attr_results
-            time.sleep(0.5)  # Avoid overwhelming the device
-            
-        return set_results
-
-    def analyze_command_ranges(self) -> Dict:
-        """Test different command numbers to find undocumented commands"""
-        command_results = {}
-        
-        for cmd in range(20):  # Test first 20 command numbers
-            if cmd in self.known_commands:
-                continue
-                
-            response = self._send_command(cmd, {})
-            if response and response.get('res') == 0:
-                command_results[cmd] = response
-                _LOGGER.info(f"Found potentially valid command {cmd}: {response}")
-                
-        return command_results
-
-    def run_full_analysis(self) -> Dict[str, Any]:
-        """Run complete device analysis"""
-        if not self.connect():
-            return {"error": "Connection failed"}
-
-        analysis_results = {
-            "device_info": self.get_device_info(),
-            "query_attributes": {},
-            "set_commands": {},
-            "unknown_commands": {},
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+            # Put the attribute back so probing does not leave the plug switched or reconfigured
+            reply = await self._request(client, CMD_SET, {'attr': [attr], 'data': {str(attr): original}})
+            restored = reply is not None and reply.get('res') == 0
+            if not restored:
+                _LOGGER.warning(f"Could not restore attr {attr} to {original}")
+            return {'attr': attr, 'accepted': accepted, 'restored': restored}
+        return probe
+
+    def _command_probe(self, cmd: int) -> Probe:
+        async def probe(client: CozyLifeClient) -> Dict[str, Any]:
+            reply = await self._request(client, cmd, {})
+            return {'cmd': cmd, 'reply': reply, 'timeout': reply is None}
+        return probe
+
+    def supported_attributes(self) -> Dict[int, Any]:
+        """Attribute -> value for every attribute the plug answered a query for"""
+        found: Dict[int, Any] = {}
+        for result in self.checkpoint.results.values():
+            data = result.get('data') if result['key'].startswith('query:') else None
+            for key, value in (data or {}).items():
+                if str(key).isdigit() and int(key) != 0:
+                    found.setdefault(int(key), value)
+        return found
+
+    def profile(self) -> Dict[str, Any]:
+        """Summarize the checkpoint into a capability profile"""
+        results = self.checkpoint.results
+        info = (results.get('info') or {}).get('info') or {}
+        attributes = {
+            attr: {'value': value} for attr, value in sorted(self.supported_attributes().items())
+        }
+        for dpid in info.get('dpid') or []:
+            if isinstance(dpid, int):
+                attributes.setdefault(dpid, {'value': None})
+        for attr, description in attributes.items():
+            set_result = results.get(f"set:{attr}")
+            if set_result is not None:
+                accepted = [int(v) for v, ok in set_result['accepted'].items() if ok]
+                description['writable'] = bool(accepted)
+                description['accepted_values'] = accepted
+        unknown_commands = {
+            result['cmd']: result['reply'] for result in results.values()
+            if result['key'].startswith('cmd:') and result.get('reply') and result['reply'].get('res') == 0
+        }
+        return {
+            'ip': self.ip,
+            'device_info': info,
+            'capabilities': sorted(attributes),
+            'attributes': {str(attr): description for attr, description in attributes.items()},
+            'unknown_commands': {str(cmd): reply for cmd, reply in sorted(unknown_commands.items())},
+            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
         }
 
-        # Run attribute analysis
-        _LOGGER.info("Analyzing QUERY attributes...")
-        analysis_results["query_attributes"] = self.analyze_query_attributes()
+    async def run_full_analysis(self) -> Dict[str, Any]:
+        """Run complete device analysis"""
+        try:
+            await self._run("Device info", [('info', self._probe_info)])
+            if self.checkpoint.get('info') is None:
+                return {"error": "Connection failed"}
 
-        # Test SET commands
-        _LOGGER.info("Analyzing SET commands...")
-        analysis_results["set_commands"] = self.analyze_set_commands(analysis_results["query_attributes"])
+            # Attribute 0 asks for everything at once; single attributes find the ones it leaves out
+            await self._run("QUERY attributes", [
+                (f"query:{attr}", self._query_probe(attr)) for attr in range(self.max_attr + 1)
+            ])
 
-        # Look for unknown commands
-        _LOGGER.info("Searching for unknown commands...")
-        analysis_results["unknown_commands"] = self.analyze_command_ranges()
+            if self.probe_set:
+                await self._run("SET commands", [
+                    (f"set:{attr}", self._set_probe(attr, value))
+                    for attr, value in sorted(self.supported_attributes().items())
+                ])
 
-        # Save results to file
-        with open(f"cozylife_analysis_{self.ip}_{time.strftime('%Y%m%d_%H%M%S')}.json", 'w') as f:
-            json.dump(analysis_results, f, indent=2)
+            await self._run("Unknown commands", [
+                (f"cmd:{cmd}", self._command_probe(cmd))
+                for cmd in range(self.max_cmd + 1) if cmd not in KNOWN_COMMANDS
+            ])
+            return self.profile()
+        finally:
+            await asyncio.gather(*(client.close() for client in self.clients))
+            self.checkpoint.close()
 
-        return analysis_results
 
 def main():
-    ip = "192.168.2.200"
-    analyzer = CozyLifeAnalyzer(ip)
-    
-    _LOGGER.info(f"Starting analysis of device at {ip}")
-    results = analyzer.run_full_analysis()
-    
-    _LOGGER.info("\n=== Analysis Complete ===")
-    _LOGGER.info(f"Results saved to cozylife_analysis_{ip}_{time.strftime('%Y%m%d_%H%M%S')}.json")
-    
-    if "error" not in results:
-        _LOGGER.info(f"\nDevice Info: {json.dumps(results['device_info'], indent=2)}")
-        _LOGGER.info(f"\nDiscovered Attributes: {len(results['query_attributes'])}")
-        _LOGGER.info(f"SET Command Tests: {len(results['set_commands'])}")
-        _LOGGER.info(f"Unknown Commands Found: {len(results['unknown_commands'])}")
-    else:
+    parser = argparse.ArgumentParser(description="Probe a CozyLife plug's attributes and commands")
+    parser.add_argument('ip', nargs='?', default="192.168.2.200")
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--connections', type=int, default=4,
+                        help="parallel connections; some firmware accepts only a few")
+    parser.add_argument('--rate', type=float, default=20.0, help="max requests per second, 0 for no limit")
+    parser.add_argument('--timeout', type=float, default=3.0)
+    parser.add_argument('--checkpoint', help="JSONL file to record to and resume from")
+    parser.add_argument('--output', help="capability profile JSON to write")
+    parser.add_argument('--max-attr', type=int, default=255)
+    parser.add_argument('--max-cmd', type=int, default=19)
+    parser.add_argument('--skip-set', action='store_true', help="do not test writing attributes")
+    parser.add_argument('--retry-timeouts', action='store_true',
+                        help="on resume, run again the probes that got no reply")
+    args = parser.parse_args()
+
+    analyzer = CozyLifeAnalyzer(
+        args.ip, args.port, connections=args.connections, rate=args.rate, timeout=args.timeout,
+        checkpoint=args.checkpoint, max_attr=args.max_attr, max_cmd=args.max_cmd,
+        probe_set=not args.skip_set, retry_timeouts=args.retry_timeouts,
+    )
+    _LOGGER.info(f"Starting analysis of device at {args.ip}")
+    started = time.monotonic()
+    try:
+        results = asyncio.run(analyzer.run_full_analysis())
+    except KeyboardInterrupt:
+        _LOGGER.info(f"Interrupted; run again with the same checkpoint ({analyzer.checkpoint.path}) to resume")
+        return
+
+    if "error" in results:
         _LOGGER.error(f"Analysis failed: {results['error']}")
+        return
+
+    output = args.output or f"cozylife_analysis_{args.ip}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    _LOGGER.info("\n=== Analysis Complete ===")
+    _LOGGER.info(f"Results saved to {output} in {time.monotonic() - started:.1f}s")
+    _LOGGER.info(f"\nDevice Info: {json.dumps(results['device_info'], indent=2)}")
+    _LOGGER.info(f"\nCapabilities: {results['capabilities']}")
+    _LOGGER.info(f"Writable attributes: {[a for a, d in results['attributes'].items() if d.get('writable')]}")
+    _LOGGER.info(f"Unknown Commands Found: {len(results['unknown_commands'])}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import timeit
+from typing import Callable, List
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__name__)
+
+PROTOCOL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "custom_components", "bettercozylife", "protocol.py",
+)
+
+
+def load_line_framer():
+    """Load LineFramer straight from protocol.py without importing Home Assistant"""
+    spec = importlib.util.spec_from_file_location("cozylife_protocol", PROTOCOL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.LineFramer
+
+
+def legacy_parse(chunks: List[bytes]) -> List[str]:
+    """The string-concatenation parser _read_response used to run, extended to return every line"""
+    lines = []
+    data = ""
+    for raw in chunks:
+        try:
+            data += raw.decode('utf-8')
+        except UnicodeDecodeError:
+            data = ""
+            continue
+        while '\n' in data:
+            line = data.split('\n')[0].strip()
+            data = data.split('\n', 1)[1] if '\n' in data else ""
+            if line:
+                lines.append(line)
+    return lines
+
+
+def framer_parse(line_framer_cls) -> Callable[[List[bytes]], List[str]]:
+    def parse(chunks: List[bytes]) -> List[str]:
+        framer = line_framer_cls()
+        lines = []
+        for raw in chunks:
+            lines.extend(framer.feed(raw))
+        return lines
+    return parse
+
+
+def make_stream(lines: int) -> bytes:
+    """Build a burst of realistic QUERY replies, one non-ASCII name included"""
+    out = []
+    for i in range(lines):
+        message = {
+            'cmd': 2, 'pv': 0, 'sn': str(1700000000000 + i),
+            'msg': {'attr': [1, 27, 28, 29], 'data': {'1': 255, '27': 120 + i % 7, '28': 25, '29': 230}},
+        }
+        if i % 50 == 0:
+            message['msg']['name'] = 'Küche'
+        out.append(json.dumps(message, ensure_ascii=False))
+    return ("\r\n".join(out) + "\r\n").encode('utf-8')
+
+
+def chunked(stream: bytes, size: int) -> List[bytes]:
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def run(line_counts: List[int], chunk_sizes: List[int], repeat: int):
+    line_framer_cls = load_line_framer()
+    parsers = {'legacy': legacy_parse, 'framer': framer_parse(line_framer_cls)}
+
+    # A multi-byte character split across reads: legacy drops the buffer, the framer must not
+    split = make_stream(1)
+    cut = split.index('ü'.encode('utf-8')) + 1
+    for name, parse in parsers.items():
+        recovered = len(parse([split[:cut], split[cut:]]))
+        _LOGGER.info(f"{name}: lines recovered from a split UTF-8 sequence: {recovered}/1")
+
+    for chunk_size in chunk_sizes:
+        for count in line_counts:
+            chunks = chunked(make_stream(count), chunk_size)
+            results = {}
+            for name, parse in parsers.items():
+                best = min(timeit.repeat(lambda: parse(chunks), number=1, repeat=repeat))
+                results[name] = best
+            _LOGGER.info(
+                f"{count:>6} lines in {len(chunks):>5} x {chunk_size}B chunks: "
+                f"legacy {results['legacy'] * 1000:8.2f} ms  "
+                f"framer {results['framer'] * 1000:8.2f} ms  "
+                f"speedup {results['legacy'] / results['framer']:6.1f}x"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy string parser with LineFramer")
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100, 1000, 5000])
+    # 1024 matches the old recv size; 65536 models a long burst returned by one read
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[1024, 65536])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.lines, args.chunk_sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
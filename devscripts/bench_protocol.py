@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import timeit
+import types
+from typing import Awaitable, Callable, Dict, List
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__name__)
+
+DEVSCRIPTS = os.path.dirname(os.path.abspath(__file__))
+CUSTOM_COMPONENTS = os.path.join(DEVSCRIPTS, "..", "custom_components")
+BASELINE_PATH = os.path.join(DEVSCRIPTS, "bench_protocol_baseline.json")
+
+SN_PATTERN = re.compile(rb'"sn":\s*"?(\d+)')
+CMD_PATTERN = re.compile(rb'"cmd":\s*(\d+)')
+
+STATE_DATA = {'1': 255, '27': 1234, '28': 285, '29': 231}
+
+
+def import_integration():
+    """Import the integration modules; Home Assistant must be installed"""
+    if CUSTOM_COMPONENTS not in sys.path:
+        sys.path.insert(0, CUSTOM_COMPONENTS)
+    from bettercozylife import connection, coordinator, cozylife_device, protocol
+    logging.getLogger("bettercozylife").setLevel(logging.WARNING)
+    return connection, coordinator, cozylife_device, protocol
+
+
+def reply_line(cmd: int, sn: str, msg: Dict) -> bytes:
+    message = {'cmd': cmd, 'pv': 0, 'sn': sn, 'res': 0, 'msg': msg}
+    return (json.dumps(message) + "\r\n").encode('utf-8')
+
+
+def state_msg(data: Dict) -> Dict:
+    return {'attr': [int(k) for k in data], 'data': data}
+
+
+class StubWriter:
+    """Stands in for the StreamWriter and answers every request synchronously
+
+    The reply is pushed through a real LineFramer and the connection's own
+    line handler, so a round trip covers command building, encoding, framing,
+    decoding and sn dispatch without a socket or a scheduler hop.
+    """
+
+    def __init__(self, connection, line_framer_cls, chunk_size: int = 0):
+        self._connection = connection
+        self._framer = line_framer_cls()
+        self._chunk_size = chunk_size
+        # Reply templates per command with the sn substituted on each request
+        self._replies = {
+            0: reply_line(0, "%SN%", {'did': "bench", 'pid': "bench", 'dmn': "Bench Plug"}),
+            2: reply_line(2, "%SN%", state_msg(STATE_DATA)),
+            3: reply_line(3, "%SN%", state_msg({'1': 255})),
+        }
+        self.bytes_written = 0
+
+    def write(self, data: bytes):
+        self.bytes_written += len(data)
+        cmd = int(CMD_PATTERN.search(data).group(1))
+        sn = SN_PATTERN.search(data).group(1)
+        reply = self._replies[cmd].replace(b"%SN%", sn)
+        step = self._chunk_size or len(reply)
+        for i in range(0, len(reply), step):
+            for line in self._framer.feed(reply[i:i + step]):
+                self._connection._handle_line(line)
+
+    async def drain(self):
+        return None
+
+    def is_closing(self) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        return None
+
+
+def attach_stub(device, connection_module, protocol_module, chunk_size: int = 0):
+    connection = connection_module.CozyLifeConnection(
+        device.ip, device.port, on_message=device._handle_message
+    )
+    connection._writer = StubWriter(connection, protocol_module.LineFramer, chunk_size)
+    device._connection = connection
+    return connection
+
+
+def time_sync(func: Callable[[], object], number: int, repeat: int) -> float:
+    """Best seconds per call over ``repeat`` runs of ``number`` calls, after one untimed run"""
+    return min(timeit.repeat(func, number=number, repeat=repeat + 1)[1:]) / number
+
+
+async def time_async(func: Callable[[], Awaitable[object]], number: int, repeat: int) -> float:
+    best = float('inf')
+    for run in range(repeat + 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            await func()
+        if run:
+            best = min(best, time.perf_counter() - started)
+    return best / number
+
+
+def decode_cases(connection_module, protocol_module) -> Dict[str, Callable[[], object]]:
+    """Feed canned device output through LineFramer and the connection's line handler"""
+    received: List[Dict] = []
+    connection = connection_module.CozyLifeConnection("192.0.2.1", 5555, on_message=received.append)
+    framer = protocol_module.LineFramer()
+
+    single = reply_line(2, "1700000000000", state_msg(STATE_DATA))
+    multi = b"".join(reply_line(2, str(1700000000000 + i), state_msg(STATE_DATA)) for i in range(10))
+    fragments = [single[i:i + 7] for i in range(0, len(single), 7)]
+
+    def run(chunks):
+        def feed():
+            received.clear()
+            for chunk in chunks:
+                for line in framer.feed(chunk):
+                    connection._handle_line(line)
+        return feed
+
+    return {
+        'decode_single': run([single]),
+        'decode_multi_10': run([multi]),
+        'decode_fragmented': run(fragments),
+    }
+
+
+async def measure(number: int, repeat: int) -> Dict[str, float]:
+    connection_module, coordinator_module, device_module, protocol_module = import_integration()
+    from homeassistant.core import HomeAssistant
+
+    results: Dict[str, float] = {}
+
+    for name, func in decode_cases(connection_module, protocol_module).items():
+        results[name] = time_sync(func, number, repeat)
+
+    device = device_module.CozyLifeDevice("192.0.2.1", timeout=3, retry_window=0)
+    attach_stub(device, connection_module, protocol_module)
+    # Sanity check: the stub must really answer, otherwise every case would time out
+    assert await device.query_state() == STATE_DATA
+    results['query_roundtrip'] = await time_async(device.query_state, number, repeat)
+    results['set_roundtrip'] = await time_async(lambda: device.set_state(True), number, repeat)
+    results['info_roundtrip'] = await time_async(device.query_info, number, repeat)
+
+    fragmented = device_module.CozyLifeDevice("192.0.2.1", timeout=3, retry_window=0)
+    attach_stub(fragmented, connection_module, protocol_module, chunk_size=16)
+    results['query_roundtrip_fragmented'] = await time_async(fragmented.query_state, number, repeat)
+
+    parse_state = sys.modules['bettercozylife.profiles'].METERED_PLUG.decode
+    # Sub-microsecond: needs many more calls per run to rise above timer noise
+    results['parse_state'] = time_sync(lambda: parse_state(STATE_DATA), number * 50, repeat)
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        entry = types.SimpleNamespace(entry_id="bench", title="bench",
+                                      data={'ip_address': "192.0.2.1", 'type': "switch"}, options={})
+        coordinator = coordinator_module.CozyLifeCoordinator(hass, entry)
+        attach_stub(coordinator.device, connection_module, protocol_module)
+        results['coordinator_update'] = await time_async(coordinator._async_update_data, number, repeat)
+
+    return results
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['cases']
+
+
+def save_baseline(path: str, results: Dict[str, float]):
+    baseline = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'unit': 'seconds per operation',
+        'cases': {name: round(value, 9) for name, value in sorted(results.items())},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+    _LOGGER.info(f"Baseline written to {path}")
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Log every case against the baseline and return the names that regressed"""
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            _LOGGER.info(f"{name:>28}: {value * 1e6:9.2f} us   (no baseline)")
+            continue
+        ratio = value / reference if reference else float('inf')
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        _LOGGER.info(f"{name:>28}: {value * 1e6:9.2f} us   baseline {reference * 1e6:9.2f} us   "
+                     f"{ratio:5.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the protocol encode/decode path and coordinator update against a stubbed transport"
+    )
+    parser.add_argument('--number', type=int, default=2000, help="Calls per timing run")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing runs per case; the best is kept")
+    parser.add_argument('--passes', type=int, default=2, help="Full passes over all cases")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--check', action='store_true', help="Exit non-zero if any case regressed")
+    # Timings vary between runs on a busy machine; only flag clear slowdowns
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown against the baseline before a case is flagged")
+    args = parser.parse_args()
+
+    # The first pass also warms caches and CPU clocks; keep the best of every pass per case
+    results: Dict[str, float] = {}
+    for _ in range(max(args.passes, 1)):
+        for name, value in asyncio.run(measure(args.number, args.repeat)).items():
+            results[name] = min(value, results.get(name, value))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        save_baseline(args.baseline, results)
+    if args.check and regressions:
+        _LOGGER.error(f"Regressed against {args.baseline}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
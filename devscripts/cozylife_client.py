@@ -0,0 +1,105 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# Lines longer than this are not a reply; the plug's own messages stay far below it
+MAX_LINE = 64 * 1024
+
+
+class CozyLifeClient:
+    """Async JSON-line client for one plug with sn matching and automatic reconnect
+
+    One request is in flight at a time; lines that do not carry its sn (state
+    reports, late replies to timed-out requests) are handed to ``on_message``
+    or dropped. A broken connection is reopened and the request sent again up
+    to ``retries`` times; a request that gets no reply in time returns None.
+    """
+
+    def __init__(self, ip: str, port: int = 5555, timeout: float = 3.0, retries: int = 2,
+                 on_message: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.on_message = on_message
+        self.connects = 0
+        self.timeouts = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+        self._last_sn = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    def _next_sn(self) -> str:
+        self._last_sn = max(int(time.time() * 1000), self._last_sn + 1)
+        return str(self._last_sn)
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.ip, self.port, limit=MAX_LINE), self.timeout
+        )
+        self.connects += 1
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def request(self, cmd: int, msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Send a command and return the reply with its sn, or None if none came in time"""
+        async with self._lock:
+            for attempt in range(self.retries + 1):
+                try:
+                    if not self.connected:
+                        await self._connect()
+                    return await self._exchange(cmd, msg)
+                except (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        ValueError) as e:
+                    # ValueError: readline hit MAX_LINE without a newline, the stream is out of sync
+                    _LOGGER.debug(f"{self.ip}: attempt {attempt + 1} failed: {e!r}")
+                    await self.close()
+                if attempt < self.retries:
+                    await asyncio.sleep(min(0.2 * 2 ** attempt, 2.0))
+            raise ConnectionError(f"{self.ip}:{self.port} unreachable after {self.retries + 1} attempts")
+
+    async def _exchange(self, cmd: int, msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        sn = self._next_sn()
+        message = {'pv': 0, 'cmd': cmd, 'sn': sn, 'msg': msg}
+        self._writer.write((json.dumps(message) + "\r\n").encode('utf-8'))
+        await self._writer.drain()
+
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                self.timeouts += 1
+                return None
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), remaining)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return None
+            if not line:
+                raise ConnectionError("connection closed by the device")
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                _LOGGER.debug(f"{self.ip}: ignoring undecodable line {line[:80]!r}")
+                continue
+            if not isinstance(reply, dict):
+                continue
+            if str(reply.get('sn')) == sn:
+                return reply
+            if self.on_message is not None:
+                self.on_message(reply)
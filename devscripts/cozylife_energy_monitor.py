@@ -1,105 +1,399 @@
-import json
-import socket
-import time
+import argparse
+import asyncio
+import csv
+import glob
 import logging
-from typing import Dict, Optional
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from cozylife_client import CozyLifeClient
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 logging.basicConfig(level=logging.INFO)
 _LOGGER = logging.getLogger(__name__)
 
-class CozyLifeEnergyMonitor:
-    def __init__(self, ip: str, port: int = 5555):
-        self.ip = ip
-        self.port = port
-        self.socket = None
-        self._connect()
-        
-    def _connect(self) -> None:
-        """Establish connection to device"""
+CUSTOM_COMPONENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components")
+
+CMD_QUERY = 2
+# Relay, current (mA), power (W) and voltage (V): what the integration polls
+DEFAULT_ATTRS = [1, 27, 28, 29]
+BASE_COLUMNS = ['time', 'device', 'rtt_ms']
+
+Row = Tuple[Any, ...]
+
+
+def attr_column(attr: int) -> str:
+    return f"attr_{attr}"
+
+
+def parse_target(target: str) -> Tuple[str, int]:
+    host, _, port = target.partition(':')
+    return host, int(port) if port else 5555
+
+
+class RotatingWriter:
+    """Writes sample batches to numbered files, starting a new one by row count or age
+
+    CSV needs nothing extra; Parquet needs pyarrow and writes every batch as a
+    row group, so a file is readable up to its last completed batch.
+    """
+
+    def __init__(self, out_dir: str, columns: List[str], file_format: str = 'csv',
+                 rotate_rows: int = 1_000_000, rotate_seconds: float = 3600.0):
+        if file_format == 'parquet' and pyarrow is None:
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow")
+        self.out_dir = out_dir
+        self.columns = columns
+        self.format = file_format
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.rows_written = 0
+        self.files: List[str] = []
+        self._file = None
+        self._csv = None
+        self._parquet = None
+        self._file_rows = 0
+        self._opened_at = 0.0
+        os.makedirs(out_dir, exist_ok=True)
+        if file_format == 'parquet':
+            types = {'time': pyarrow.float64(), 'device': pyarrow.string(), 'rtt_ms': pyarrow.float64()}
+            self._schema = pyarrow.schema([(name, types.get(name, pyarrow.int64())) for name in columns])
+
+    def _open(self):
+        path = os.path.join(
+            self.out_dir, f"energy_{time.strftime('%Y%m%d_%H%M%S')}_{len(self.files):04d}.{self.format}"
+        )
+        if self.format == 'parquet':
+            self._parquet = pyarrow.parquet.ParquetWriter(path, self._schema)
+        else:
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(self.columns)
+        self.files.append(path)
+        self._file_rows = 0
+        self._opened_at = time.monotonic()
+        _LOGGER.info(f"Writing samples to {path}")
+
+    def _close_file(self):
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._csv = None
+
+    def write(self, rows: Sequence[Row]):
+        while rows:
+            if self._file_rows >= self.rotate_rows or (
+                (self._file or self._parquet) and time.monotonic() - self._opened_at >= self.rotate_seconds
+            ):
+                self._close_file()
+            if self._file is None and self._parquet is None:
+                self._open()
+            batch, rows = rows[:self.rotate_rows - self._file_rows], rows[self.rotate_rows - self._file_rows:]
+            if self._parquet is not None:
+                columns = list(zip(*batch))
+                self._parquet.write_table(pyarrow.Table.from_arrays(
+                    [pyarrow.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+                    schema=self._schema,
+                ))
+            else:
+                self._csv.writerows(batch)
+                self._file.flush()
+            self._file_rows += len(batch)
+            self.rows_written += len(batch)
+
+    def close(self):
+        self._close_file()
+
+
+class EnergyRecorder:
+    """Samples many plugs concurrently and streams the readings to a RotatingWriter
+
+    Every plug is polled on its own connection at a fixed cadence, with the
+    plugs spread evenly over the interval. Samples pass through a bounded
+    queue to a single writer that flushes them in batches; when the writer
+    falls behind, new samples are dropped and counted instead of piling up.
+    """
+
+    def __init__(self, targets: List[Tuple[str, int]], writer: RotatingWriter, interval: float = 1.0,
+                 attrs: Optional[List[int]] = None, timeout: float = 2.0, batch_size: int = 1000,
+                 flush_interval: float = 1.0, max_buffer: int = 100_000):
+        self.targets = targets
+        self.writer = writer
+        self.interval = interval
+        self.attrs = attrs or DEFAULT_ATTRS
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self.samples = 0
+        self.misses = 0
+        self.dropped = 0
+        # asyncio.wait_for before Python 3.12 can swallow a cancel that arrives as its
+        # read completes, so the loops also check this flag instead of relying on cancel alone
+        self._stopping = False
+
+    async def _sample_device(self, index: int, host: str, port: int):
+        client = CozyLifeClient(host, port, timeout=min(self.timeout, self.interval * 0.9), retries=0)
+        device = f"{host}:{port}"
+        keys = [str(attr) for attr in self.attrs]
+        msg = {'attr': self.attrs}
+        loop = asyncio.get_running_loop()
+        # Spread the plugs over the interval instead of querying all at once
+        next_tick = loop.time() + self.interval * index / max(len(self.targets), 1)
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(3)
-            self.socket.connect((self.ip, self.port))
-        except Exception as e:
-            _LOGGER.error(f"Connection failed: {e}")
-            raise
+            while not self._stopping:
+                delay = next_tick - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                started = loop.time()
+                try:
+                    reply = await client.request(CMD_QUERY, msg)
+                except ConnectionError as e:
+                    _LOGGER.debug(f"{device}: {e}")
+                    reply = None
+                msg_data = reply.get('msg') if reply else None
+                data = msg_data.get('data') if isinstance(msg_data, dict) else None
+                if isinstance(data, dict):
+                    row = (round(time.time(), 3), device, round((loop.time() - started) * 1000, 2),
+                           *(data.get(key) for key in keys))
+                    try:
+                        self.queue.put_nowait(row)
+                        self.samples += 1
+                    except asyncio.QueueFull:
+                        self.dropped += 1
+                else:
+                    self.misses += 1
+                # Fixed cadence; ticks missed while a request hung are skipped, not made up
+                next_tick += self.interval
+                now = loop.time()
+                if next_tick < now:
+                    next_tick += (now - next_tick) // self.interval * self.interval + self.interval
+        finally:
+            await client.close()
 
-    def _get_package(self, cmd: int, payload: dict) -> bytes:
-        """Generate command package"""
-        sn = str(int(round(time.time() * 1000)))
-        message = {
-            'pv': 0,
-            'cmd': cmd,
-            'sn': sn,
-            'msg': payload
-        }
-        
-        if cmd == 2:  # QUERY command
-            message['msg'] = {'attr': [0]}
-            
-        return bytes(json.dumps(message) + "\r\n", encoding='utf8')
-
-    def _send_command(self, cmd: int, payload: dict) -> Optional[dict]:
-        """Send command and get response"""
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        batch: List[Row] = []
+        writing: Optional[asyncio.Future] = None
+        deadline = loop.time() + self.flush_interval
         try:
-            package = self._get_package(cmd, payload)
-            self.socket.send(package)
-            response = self.socket.recv(1024)
-            return json.loads(response.strip())
-        except Exception as e:
-            _LOGGER.error(f"Command failed: {e}")
-            self._connect()  # Try to reconnect
-            return None
-
-    def get_energy_data(self) -> Dict:
-        """Query all potentially energy-related attributes"""
-        # Query specific attributes we found in analysis
-        payload = {'attr': [1, 2, 26, 28]}  # Key attributes found in analysis
-        response = self._send_command(2, payload)
-        
-        if not response or 'msg' not in response or 'data' not in response['msg']:
-            return {}
-
-        data = response['msg']['data']
-        
-        # Map the data to more meaningful names based on analysis
-        energy_data = {
-            'power_state': data.get('1', 0),  # On/Off state
-            'mode': data.get('2', 0),         # Operating mode
-            'power': data.get('26', 0),       # Possibly current power draw
-            'energy': data.get('28', 0)       # Possibly accumulated energy
-        }
-        
-        return energy_data
-
-    def monitor_energy(self, interval: int = 5):
-        """Continuously monitor energy usage"""
+            while not self._stopping:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), max(deadline - loop.time(), 0)))
+                except asyncio.TimeoutError:
+                    pass
+                # Take whatever else is already queued without waiting
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                if len(batch) >= self.batch_size or loop.time() >= deadline:
+                    if batch:
+                        # Files are written off the event loop so sampling keeps its cadence
+                        writing = loop.run_in_executor(None, self.writer.write, batch)
+                        batch = []
+                        await asyncio.shield(writing)
+                    deadline = loop.time() + self.flush_interval
+        except asyncio.CancelledError:
+            await self._write_remaining(batch, writing)
+            raise
+        await self._write_remaining(batch, writing)
+
+    async def _write_remaining(self, batch: List[Row], writing: Optional[asyncio.Future]):
+        # A batch still being written must finish before the rest goes out
+        if writing is not None and not writing.done():
+            await asyncio.wait([writing])
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            self.writer.write(batch)
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(10)
+            _LOGGER.info(f"{self.samples} samples, {self.writer.rows_written} written, "
+                         f"{self.misses} missed, {self.dropped} dropped")
+
+    async def run(self, duration: Optional[float] = None):
+        samplers: List[asyncio.Task] = []
+        # The report loop and the wait for the end of the recording
+        others: List[asyncio.Future] = []
+        writer_task: Optional[asyncio.Task] = None
+        self._stopping = False
         try:
-            while True:
-                energy_data = self.get_energy_data()
-                if energy_data:
-                    _LOGGER.info(f"""
-Energy Stats:
-- Power State: {'On' if energy_data['power_state'] else 'Off'}
-- Mode: {energy_data['mode']}
-- Current Power: {energy_data['power']} 
-- Accumulated Energy: {energy_data['energy']}
-""")
-                time.sleep(interval)
-        except KeyboardInterrupt:
-            _LOGGER.info("Monitoring stopped by user")
+            samplers.extend(asyncio.create_task(self._sample_device(i, host, port))
+                            for i, (host, port) in enumerate(self.targets))
+            writer_task = asyncio.create_task(self._write_loop())
+            others.append(asyncio.create_task(self._report_loop()))
+            sampling = asyncio.ensure_future(asyncio.sleep(duration) if duration else asyncio.gather(*samplers))
+            others.append(sampling)
+            # A failed writer ends the recording; otherwise every later sample would just be dropped
+            await asyncio.wait([sampling, writer_task], return_when=asyncio.FIRST_COMPLETED)
+            if sampling.done():
+                sampling.result()
         finally:
-            if self.socket:
-                self.socket.close()
+            self._stopping = True
+            for task in samplers + others:
+                task.cancel()
+            await asyncio.gather(*samplers, *others, return_exceptions=True)
+            if writer_task is not None:
+                writer_task.cancel()
+                await asyncio.gather(writer_task, return_exceptions=True)
+            self.writer.close()
+            _LOGGER.info(f"{self.samples} samples from {len(self.targets)} plugs, {self.misses} missed, "
+                         f"{self.dropped} dropped, {self.writer.rows_written} rows in {len(self.writer.files)} files")
+        error = None if writer_task.cancelled() else writer_task.exception()
+        if error is not None:
+            _LOGGER.error(f"Writing the recording failed, sampling stopped: {error!r}")
+            raise error
+
+
+def read_recording(paths: List[str]) -> Iterator[Tuple[float, str, Dict[str, Any]]]:
+    """Yield (time, device, raw attributes) from recorded CSV and Parquet files in order"""
+    for path in paths:
+        if path.endswith('.parquet'):
+            if pyarrow is None:
+                raise RuntimeError(f"Reading {path} needs pyarrow: pip install pyarrow")
+            table = pyarrow.parquet.read_table(path)
+            attrs = [(name, name[len('attr_'):]) for name in table.column_names if name.startswith('attr_')]
+            columns = {name: table.column(name).to_pylist() for name in ['time', 'device'] + [a for a, _ in attrs]}
+            for i in range(table.num_rows):
+                raw = {key: columns[name][i] for name, key in attrs if columns[name][i] is not None}
+                yield columns['time'][i], columns['device'][i], raw
+        else:
+            with open(path, newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                attrs = [(i, name[len('attr_'):]) for i, name in enumerate(header) if name.startswith('attr_')]
+                time_index = header.index('time')
+                device_index = header.index('device')
+                for row in reader:
+                    raw = {key: int(row[i]) for i, key in attrs if row[i] != ''}
+                    yield float(row[time_index]), row[device_index], raw
+
+
+def replay(paths: List[str], repeat: int = 1) -> Dict[str, Any]:
+    """Feed recorded samples through the integration's per-sample path; Home Assistant must be installed
+
+    Every sample is decoded with the metered plug profile, integrated into a
+    per-plug energy total and appended to a per-plug sample ring, as the
+    coordinator does for every poll.
+    """
+    if CUSTOM_COMPONENTS not in sys.path:
+        sys.path.insert(0, CUSTOM_COMPONENTS)
+    from bettercozylife.const import DEFAULT_MAX_POLL_INTERVAL, ENERGY_MAX_GAP_INTERVALS
+    from bettercozylife.energy import EnergyAccumulator
+    from bettercozylife.profiles import METERED_PLUG
+    from bettercozylife.samples import SampleRing
+
+    samples = list(read_recording(paths))
+    if not samples:
+        return {'samples': 0}
+    # Gaps longer than the coordinator's limit are outages and are not integrated
+    max_gap = ENERGY_MAX_GAP_INTERVALS * DEFAULT_MAX_POLL_INTERVAL
+    decode = METERED_PLUG.decode
+    sampled_keys = METERED_PLUG.sampled_keys
+    devices: Dict[str, Tuple[EnergyAccumulator, SampleRing]] = {}
+    started = time.perf_counter()
+    for _ in range(repeat):
+        devices.clear()
+        for timestamp, device, raw in samples:
+            state = devices.get(device)
+            if state is None:
+                state = devices[device] = (EnergyAccumulator(max_gap), SampleRing(2048, sampled_keys))
+            result = decode(raw)
+            power = result['power']
+            if power is not None:
+                state[0].add_sample(power, timestamp)
+            state[1].append(timestamp, [float('nan') if result[key] is None else result[key]
+                                        for key in sampled_keys])
+    elapsed = time.perf_counter() - started
+    total = len(samples) * repeat
+    last_time = samples[-1][0]
+    return {
+        'samples': total,
+        'seconds': elapsed,
+        'samples_per_second': total / elapsed if elapsed else 0.0,
+        'us_per_sample': elapsed / total * 1e6,
+        'devices': {
+            device: {
+                'energy_kwh': round(energy.total_kwh, 6),
+                'power': ring.summary('power', last_time, last_time - samples[0][0] + 1),
+            }
+            for device, (energy, ring) in sorted(devices.items())
+        },
+    }
+
 
 def main():
-    ip = "192.168.2.200"
+    parser = argparse.ArgumentParser(description="Record CozyLife plug readings, or replay recordings")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help="sample plugs and write columnar files")
+    record.add_argument('targets', nargs='+', help="plug addresses as IP or IP:PORT")
+    record.add_argument('--interval', type=float, default=1.0, help="seconds between samples of a plug")
+    record.add_argument('--attrs', default=','.join(str(a) for a in DEFAULT_ATTRS),
+                        help="comma separated attributes to record")
+    record.add_argument('--out-dir', default='energy_logs')
+    record.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    record.add_argument('--rotate-rows', type=int, default=1_000_000)
+    record.add_argument('--rotate-seconds', type=float, default=3600.0)
+    record.add_argument('--batch-size', type=int, default=1000)
+    record.add_argument('--flush-interval', type=float, default=1.0)
+    record.add_argument('--max-buffer', type=int, default=100_000,
+                        help="samples held in memory before new ones are dropped")
+    record.add_argument('--timeout', type=float, default=2.0)
+    record.add_argument('--duration', type=float, help="stop after this many seconds")
+
+    replay_parser = commands.add_parser('replay', help="run recorded samples through the integration's parsing")
+    replay_parser.add_argument('paths', nargs='+', help="recorded files or glob patterns")
+    replay_parser.add_argument('--repeat', type=int, default=1, help="replay the recording this many times")
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        paths = sorted(path for pattern in args.paths for path in (glob.glob(pattern) or [pattern]))
+        try:
+            result = replay(paths, args.repeat)
+        except RuntimeError as e:
+            _LOGGER.error(str(e))
+            return
+        if not result['samples']:
+            _LOGGER.error("No samples in the recording")
+            return
+        _LOGGER.info(f"Replayed {result['samples']} samples in {result['seconds']:.3f}s: "
+                     f"{result['samples_per_second']:.0f}/s, {result['us_per_sample']:.2f} us each")
+        for device, summary in result['devices'].items():
+            power = summary['power'] or {}
+            _LOGGER.info(f"{device}: {summary['energy_kwh']} kWh, power mean {power.get('mean')} "
+                         f"max {power.get('max')} p95 {power.get('p95')}")
+        return
+
+    attrs = [int(attr) for attr in args.attrs.split(',') if attr]
     try:
-        monitor = CozyLifeEnergyMonitor(ip)
-        _LOGGER.info(f"Starting energy monitoring for device at {ip}")
-        monitor.monitor_energy()
-    except Exception as e:
-        _LOGGER.error(f"Monitoring failed: {e}")
+        writer = RotatingWriter(args.out_dir, BASE_COLUMNS + [attr_column(attr) for attr in attrs],
+                                args.format, args.rotate_rows, args.rotate_seconds)
+    except RuntimeError as e:
+        _LOGGER.error(str(e))
+        return
+    recorder = EnergyRecorder(
+        [parse_target(target) for target in args.targets], writer, interval=args.interval, attrs=attrs,
+        timeout=args.timeout, batch_size=args.batch_size, flush_interval=args.flush_interval,
+        max_buffer=args.max_buffer,
+    )
+    _LOGGER.info(f"Recording {len(recorder.targets)} plugs every {args.interval}s to {args.out_dir}")
+    try:
+        asyncio.run(recorder.run(args.duration))
+    except KeyboardInterrupt:
+        _LOGGER.info("Monitoring stopped by user")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,7 @@
+"""Local CozyLife device simulator and load-test harness.
+
+Run from the devscripts directory:
+
+    python -m cozylife_sim.simulator --count 100 --base-port 20000
+    python -m cozylife_sim.loadtest --sizes 10 100 1000
+"""
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from typing import Awaitable, Callable, Dict, List
+
+from .simulator import SimulatedFleet, add_fault_arguments, faults_from_args, raise_fd_limit
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__name__)
+
+CUSTOM_COMPONENTS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "custom_components"
+)
+
+
+def import_integration():
+    """Import the integration modules; Home Assistant must be installed"""
+    if CUSTOM_COMPONENTS not in sys.path:
+        sys.path.insert(0, CUSTOM_COMPONENTS)
+    from bettercozylife import coordinator, cozylife_device
+    # Injected faults make the coordinator log every failed and recovered fetch
+    logging.getLogger("bettercozylife").setLevel(logging.CRITICAL)
+    return cozylife_device, coordinator
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class LoadResult:
+    def __init__(self, mode: str, size: int):
+        self.mode = mode
+        self.size = size
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        values = sorted(self.latencies)
+        total = len(values) + self.errors
+        return {
+            'mode': self.mode,
+            'size': self.size,
+            'requests': total,
+            'throughput': total / self.elapsed if self.elapsed else 0.0,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'errors': self.errors,
+        }
+
+
+async def drive(result: LoadResult, calls: List[Callable[[], Awaitable[bool]]],
+                duration: float, interval: float):
+    """Call every target in its own closed loop for ``duration`` seconds"""
+    deadline = time.perf_counter() + duration
+
+    async def _loop(call):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = await call()
+            except Exception:
+                ok = False
+            if ok:
+                result.latencies.append(time.perf_counter() - started)
+            else:
+                result.errors += 1
+            if interval:
+                await asyncio.sleep(interval)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_loop(call) for call in calls))
+    result.elapsed = time.perf_counter() - started
+
+
+async def run_device_load(fleet: SimulatedFleet, duration: float, interval: float, timeout: float) -> LoadResult:
+    cozylife_device, _ = import_integration()
+    devices = [
+        cozylife_device.CozyLifeDevice(plug.host, port=plug.port, timeout=timeout, retry_window=0)
+        for plug in fleet.plugs
+    ]
+
+    def _query(device):
+        async def call():
+            return await device.query_state() is not None
+        return call
+
+    result = LoadResult('device', len(devices))
+    try:
+        await drive(result, [_query(device) for device in devices], duration, interval)
+    finally:
+        await asyncio.gather(*(device.close() for device in devices))
+    return result
+
+
+async def run_coordinator_load(fleet: SimulatedFleet, duration: float, interval: float, timeout: float) -> LoadResult:
+    _, coordinator_module = import_integration()
+    from bettercozylife.const import DEVICE_TYPE_SWITCH
+    from homeassistant.core import HomeAssistant
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+
+        coordinators = []
+        for plug in fleet.plugs:
+            entry = types.SimpleNamespace(
+                entry_id=plug.did, title=plug.did, data={'ip_address': plug.host, 'type': DEVICE_TYPE_SWITCH},
+                options={'timeout': timeout, 'retry_window': 0},
+            )
+            coordinator = coordinator_module.CozyLifeCoordinator(hass, entry)
+            coordinator.device.port = plug.port
+            coordinators.append(coordinator)
+
+        def _refresh(coordinator):
+            async def call():
+                await coordinator.async_refresh()
+                return coordinator.last_update_success
+            return call
+
+        result = LoadResult('coordinator', len(coordinators))
+        try:
+            await drive(result, [_refresh(c) for c in coordinators], duration, interval)
+        finally:
+            await asyncio.gather(*(c.async_shutdown() for c in coordinators))
+        return result
+
+
+async def run(args) -> List[Dict[str, float]]:
+    faults = faults_from_args(args)
+    summaries = []
+    for size in args.sizes:
+        fleet = SimulatedFleet(size, args.base_port, faults)
+        await fleet.start()
+        try:
+            for mode in args.modes:
+                runner = run_device_load if mode == 'device' else run_coordinator_load
+                result = await runner(fleet, args.duration, args.interval, args.timeout)
+                summary = result.summary()
+                summaries.append(summary)
+                _LOGGER.info(
+                    f"{summary['mode']:>11} x {summary['size']:>5}: "
+                    f"{summary['requests']:>7} req  {summary['throughput']:9.1f} req/s  "
+                    f"p50 {summary['p50_ms']:7.2f} ms  p99 {summary['p99_ms']:7.2f} ms  "
+                    f"errors {summary['errors']}"
+                )
+        finally:
+            await fleet.stop()
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CozyLifeDevice and coordinator throughput against simulated plugs")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--modes', nargs='+', choices=['device', 'coordinator'], default=['device', 'coordinator'])
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per size and mode")
+    parser.add_argument('--interval', type=float, default=0.0, help="Pause between requests per plug")
+    parser.add_argument('--timeout', type=float, default=3.0)
+    parser.add_argument('--base-port', type=int, default=20000)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    raise_fd_limit(max(args.sizes) * 4 + 256)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
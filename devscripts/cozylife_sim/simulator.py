@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__name__)
+
+CMD_INFO = 0
+CMD_QUERY = 2
+CMD_SET = 3
+# Unsolicited state report
+CMD_REPORT = 10
+
+GARBAGE_LINES = [b"\x00\xff\xfe", b"{\"cmd\":2,\"pv\":0,", b"not json", b"\xc3"]
+
+
+@dataclass
+class FaultProfile:
+    """Faults injected into every request a virtual plug receives"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # Probability that a request gets no reply at all
+    drop_rate: float = 0.0
+    # Probability that the connection is reset instead of replying
+    reset_rate: float = 0.0
+    # Probability that a garbage line is written before the reply
+    garbage_rate: float = 0.0
+    # Seconds between unsolicited reports; 0 disables them
+    push_interval: float = 0.0
+
+
+class VirtualPlug:
+    """One simulated CozyLife plug speaking the port-5555 JSON-line protocol"""
+
+    def __init__(self, index: int, port: int, faults: FaultProfile, host: str = "127.0.0.1"):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.faults = faults
+        self.did = f"sim{index:06d}"
+        self.mac = "02:00:%02x:%02x:%02x:%02x" % (
+            (index >> 24) & 0xFF, (index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF
+        )
+        self.state: Dict[str, int] = {'1': 0, '2': 0, '27': 0, '28': 0, '29': 230}
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._push_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        if self.faults.push_interval > 0:
+            self._push_task = asyncio.create_task(self._push_loop())
+
+    async def stop(self):
+        if self._push_task:
+            self._push_task.cancel()
+        for writer in list(self._writers):
+            writer.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _tick(self):
+        """Random-walk the meter so readings move like a real load"""
+        if self.state['1']:
+            power = max(0, self.state['28'] + random.randint(-5, 5)) or random.randint(5, 2000)
+        else:
+            power = 0
+        self.state['28'] = power
+        self.state['29'] = 230 + random.randint(-3, 3)
+        self.state['27'] = int(power * 1000 / self.state['29'])
+
+    def _reply(self, message: dict) -> dict:
+        cmd = message.get('cmd')
+        sn = message.get('sn')
+        msg = message.get('msg') or {}
+        if cmd == CMD_INFO:
+            return {'cmd': CMD_INFO, 'pv': 0, 'sn': sn, 'res': 0, 'msg': {
+                'did': self.did, 'pid': 'sim', 'dmn': 'Simulated Plug', 'mac': self.mac,
+                'ip': self.host, 'dpid': [int(k) for k in self.state],
+            }}
+        if cmd == CMD_QUERY:
+            self._tick()
+            attrs = [str(a) for a in msg.get('attr', [])]
+            if attrs == ['0']:
+                attrs = list(self.state)
+            data = {a: self.state[a] for a in attrs if a in self.state}
+            return {'cmd': CMD_QUERY, 'pv': 0, 'sn': sn, 'res': 0,
+                    'msg': {'attr': [int(a) for a in data], 'data': data}}
+        if cmd == CMD_SET:
+            data = {str(k): v for k, v in (msg.get('data') or {}).items() if str(k) in self.state}
+            self.state.update(data)
+            if '1' in data:
+                self.state['1'] = 255 if data['1'] else 0
+                self._tick()
+            return {'cmd': CMD_SET, 'pv': 0, 'sn': sn, 'res': 0,
+                    'msg': {'attr': [int(a) for a in data], 'data': data}}
+        return {'cmd': cmd, 'pv': 0, 'sn': sn, 'res': 1}
+
+    def _report(self) -> bytes:
+        report = {'cmd': CMD_REPORT, 'pv': 0, 'sn': str(int(time.time() * 1000)),
+                  'msg': {'attr': [1, 27, 28, 29],
+                          'data': {k: self.state[k] for k in ('1', '27', '28', '29')}}}
+        return (json.dumps(report) + "\r\n").encode('utf-8')
+
+    async def _push_loop(self):
+        while True:
+            await asyncio.sleep(self.faults.push_interval * random.uniform(0.5, 1.5))
+            self._tick()
+            payload = self._report()
+            for writer in list(self._writers):
+                try:
+                    writer.write(payload)
+                except Exception:
+                    self._writers.discard(writer)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        faults = self.faults
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                self.requests += 1
+
+                if faults.latency_ms or faults.jitter_ms:
+                    delay = faults.latency_ms + random.uniform(-faults.jitter_ms, faults.jitter_ms)
+                    await asyncio.sleep(max(delay, 0) / 1000)
+                roll = random.random()
+                if roll < faults.reset_rate:
+                    writer.transport.abort()
+                    return
+                if roll < faults.reset_rate + faults.drop_rate:
+                    continue
+                if random.random() < faults.garbage_rate:
+                    writer.write(random.choice(GARBAGE_LINES) + b"\n")
+
+                was_on = self.state['1']
+                writer.write((json.dumps(self._reply(message)) + "\r\n").encode('utf-8'))
+                if faults.push_interval > 0 and self.state['1'] != was_on:
+                    writer.write(self._report())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+class SimulatedFleet:
+    """Many virtual plugs on consecutive localhost ports"""
+
+    def __init__(self, count: int, base_port: int = 20000, faults: Optional[FaultProfile] = None,
+                 host: str = "127.0.0.1"):
+        self.faults = faults or FaultProfile()
+        self.plugs: List[VirtualPlug] = [
+            VirtualPlug(i, base_port + i, self.faults, host) for i in range(count)
+        ]
+
+    async def start(self):
+        await asyncio.gather(*(plug.start() for plug in self.plugs))
+        _LOGGER.info(f"Started {len(self.plugs)} virtual plugs on ports "
+                     f"{self.plugs[0].port}-{self.plugs[-1].port}" if self.plugs else "No plugs")
+
+    async def stop(self):
+        await asyncio.gather(*(plug.stop() for plug in self.plugs))
+
+    @property
+    def requests(self) -> int:
+        return sum(plug.requests for plug in self.plugs)
+
+
+def raise_fd_limit(wanted: int):
+    """Each plug needs a listening socket and each client connection two fds"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+    except (ImportError, ValueError, OSError) as e:
+        _LOGGER.warning(f"Could not raise the open file limit: {e}")
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--reset-rate', type=float, default=0.0)
+    parser.add_argument('--garbage-rate', type=float, default=0.0)
+    parser.add_argument('--push-interval', type=float, default=0.0)
+
+
+def faults_from_args(args) -> FaultProfile:
+    return FaultProfile(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, drop_rate=args.drop_rate,
+        reset_rate=args.reset_rate, garbage_rate=args.garbage_rate, push_interval=args.push_interval,
+    )
+
+
+async def serve(count: int, base_port: int, faults: FaultProfile):
+    fleet = SimulatedFleet(count, base_port, faults)
+    await fleet.start()
+    try:
+        while True:
+            await asyncio.sleep(10)
+            _LOGGER.info(f"{fleet.requests} requests served")
+    finally:
+        await fleet.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated CozyLife plugs on localhost")
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--base-port', type=int, default=20000)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    raise_fd_limit(args.count * 3 + 256)
+    try:
+        asyncio.run(serve(args.count, args.base_port, faults_from_args(args)))
+    except KeyboardInterrupt:
+        _LOGGER.info("Simulator stopped by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Optional
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__name__)
+
+CUSTOM_COMPONENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components")
+
+
+def load_integration():
+    """Import the integration's device and trace modules; Home Assistant must be installed"""
+    if CUSTOM_COMPONENTS not in sys.path:
+        sys.path.insert(0, CUSTOM_COMPONENTS)
+    from bettercozylife import cozylife_device, protocol, trace
+    return cozylife_device, protocol, trace
+
+
+async def record(ip: str, port: int, path: str, duration: float, interval: float, timeout: float):
+    """Poll a plug like the integration does and save every frame of the exchange"""
+    cozylife_device, _, trace = load_integration()
+    device = cozylife_device.CozyLifeDevice(ip, port, timeout=timeout)
+    await device.start_trace()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    polls = answered = 0
+    try:
+        await device.query_info()
+        while loop.time() < deadline:
+            polls += 1
+            answered += await device.query_state() is not None
+            await asyncio.sleep(max(0.0, min(interval, deadline - loop.time())))
+    finally:
+        recorder = await device.stop_trace()
+        await device.close()
+    recorder.save(path)
+    _LOGGER.info(f"Saved {len(recorder.events)} events to {path}: {answered}/{polls} polls answered"
+                 f"{' (truncated)' if recorder.truncated else ''}")
+
+
+def _reply_key(reply: Optional[Dict[str, Any]]) -> Optional[str]:
+    # The sn is the only part of a reply that differs between runs
+    if reply is None:
+        return None
+    return json.dumps({key: value for key, value in reply.items() if key != 'sn'}, sort_keys=True)
+
+
+async def replay(path: str, speed: float, timeout: float) -> Dict[str, Any]:
+    """Send the recorded requests through CozyLifeDevice against the trace
+
+    Requests go out at their recorded offsets divided by ``speed`` (0 for as
+    fast as possible). A recorded failed connect is replayed as a request that
+    fails to connect. The digest covers every reply without its sn, so two
+    runs of the same trace agree exactly when the client behaved the same.
+    """
+    cozylife_device, protocol, trace = load_integration()
+    header, events = trace.load_trace(path)
+    replayer = trace.TraceReplayer(events, speed)
+    # The breaker must not refuse requests the recording made
+    device = cozylife_device.CozyLifeDevice(
+        header['ip'], header['port'], timeout=timeout, failure_threshold=sys.maxsize,
+        open_connection=replayer.open_connection,
+    )
+    frames = [(offset, kind, data) for offset, kind, data in events
+              if kind in (trace.EVENT_TX, trace.EVENT_CONNECT_FAIL)]
+    templates = []
+    last = None
+    for _, kind, data in reversed(frames):
+        if kind == trace.EVENT_TX:
+            message = json.loads(data)
+            last = protocol.CommandTemplate(message['cmd'], message['msg'])
+        templates.append(last)
+    templates.reverse()
+
+    digest = hashlib.sha256()
+    replies = 0
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    base = frames[0][0] if frames else 0.0
+    try:
+        for (offset, _, _), template in zip(frames, templates):
+            if template is None:
+                continue
+            if speed > 0:
+                delay = started + (offset - base) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            reply = await device._send_message(template)
+            replies += reply is not None
+            digest.update((_reply_key(reply) or 'null').encode() + b"\n")
+    finally:
+        await device.close()
+    elapsed = loop.time() - started
+    recorded = (frames[-1][0] - base) if frames else 0.0
+    return {
+        'requests': len(frames),
+        'replies': replies,
+        'recorded_seconds': round(recorded, 3),
+        'replay_seconds': round(elapsed, 3),
+        'digest': digest.hexdigest(),
+        'metrics': device.metrics.as_dict(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a plug's protocol traffic, or replay a recorded trace")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="poll a plug and save every frame to a trace")
+    record_parser.add_argument('ip')
+    record_parser.add_argument('--port', type=int, default=5555)
+    record_parser.add_argument('--out', help="trace file to write")
+    record_parser.add_argument('--duration', type=float, default=60.0)
+    record_parser.add_argument('--interval', type=float, default=1.0, help="seconds between polls")
+    record_parser.add_argument('--timeout', type=float, default=3.0)
+
+    replay_parser = commands.add_parser('replay', help="run the device client against a recorded trace")
+    replay_parser.add_argument('trace')
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                               help="1 for recorded timing, 10 for ten times faster, 0 for no delays")
+    replay_parser.add_argument('--runs', type=int, default=1, help="replay several times and compare")
+    replay_parser.add_argument('--timeout', type=float,
+                               help="reply timeout; defaults to 3s scaled by the speed")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        out = args.out or f"cozylife_trace_{args.ip}_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"
+        asyncio.run(record(args.ip, args.port, out, args.duration, args.interval, args.timeout))
+        return
+
+    timeout = args.timeout or (3.0 / args.speed if args.speed > 0 else 0.05)
+    digests = set()
+    for run in range(args.runs):
+        result = asyncio.run(replay(args.trace, args.speed, max(timeout, 0.05)))
+        digests.add(result['digest'])
+        metrics = result['metrics']
+        _LOGGER.info(f"Run {run + 1}: {result['replies']}/{result['requests']} replies, "
+                     f"{result['recorded_seconds']}s recorded in {result['replay_seconds']}s, "
+                     f"timeouts {metrics['timeouts']} errors {metrics['errors']} resets {metrics['resets']} "
+                     f"reconnects {metrics['reconnects']} invalid {metrics['invalid_messages']}, "
+                     f"digest {result['digest'][:16]}")
+    if args.runs > 1:
+        if len(digests) == 1:
+            _LOGGER.info("All runs produced identical replies")
+        else:
+            _LOGGER.warning(f"Runs differ: {len(digests)} distinct reply sequences")
+
+
+if __name__ == "__main__":
+    main()